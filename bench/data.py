@@ -0,0 +1,165 @@
+import collections
+import datetime
+import random
+import threading
+import time
+
+
+Scale = collections.namedtuple('Scale', (
+    'users',
+    'series',
+    'episodes_per_series',
+    'subscriptions_per_user',
+    'huge_series_episodes',
+    # share of each subscription watched in order, below the watermark
+    'watched_fraction',
+    # share of the remaining episodes watched out of order, as seen rows
+    'out_of_order_fraction',
+))
+
+SCALES = {
+    'small': Scale(
+        users=5,
+        series=50,
+        episodes_per_series=60,
+        subscriptions_per_user=20,
+        huge_series_episodes=2000,
+        watched_fraction=0.7,
+        out_of_order_fraction=0.05,
+    ),
+    'medium': Scale(
+        users=25,
+        series=500,
+        episodes_per_series=120,
+        subscriptions_per_user=60,
+        huge_series_episodes=10000,
+        watched_fraction=0.7,
+        out_of_order_fraction=0.05,
+    ),
+    'large': Scale(
+        users=100,
+        series=3000,
+        episodes_per_series=200,
+        subscriptions_per_user=150,
+        huge_series_episodes=30000,
+        watched_fraction=0.7,
+        out_of_order_fraction=0.05,
+    ),
+}
+
+FIRST_SERIES_ID = 1000000
+FIRST_EPISODE_ID = 50000000
+
+ADJECTIVES = ('Broken', 'Silent', 'Golden', 'Last', 'Hidden', 'Northern', 'Lucky', 'Wild', 'Quiet', 'Burning')
+NOUNS = ('Harbor', 'Kingdom', 'Precinct', 'Kitchen', 'Frontier', 'Hospital', 'Academy', 'Empire', 'Island', 'Signal')
+NETWORKS = ('ABC', 'CBS', 'NBC', 'FOX', 'HBO', 'AMC', 'FX', 'The CW', 'Netflix', 'BBC One')
+AIR_TIMES = ('8:00 PM', '8:30 PM', '9:00 PM', '10:00 PM', '21:00', '9PM', None)
+RUNTIMES = ('30', '45', '60', None)
+WORDS = ('the', 'team', 'finds', 'a', 'secret', 'while', 'old', 'friends', 'return', 'to', 'town', 'and', 'trouble')
+
+# the newest episode of a series airs somewhere in this range of days around today
+LATEST_EPISODE_DAYS = (-730, 56)
+
+
+class Catalog(object):
+    # Deterministic tvdb data for a scale: the same seed always produces the same series and episodes.
+    def __init__(self, scale, seed=0, now=None):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_episode_id = FIRST_EPISODE_ID
+        now = int(time.time()) if now is None else now
+        self.series = collections.OrderedDict()
+        self.episodes = {}
+        for index in range(scale.series):
+            self._add_series(FIRST_SERIES_ID + index, scale.episodes_per_series, now)
+        self.huge_series_id = FIRST_SERIES_ID + scale.series
+        self._add_series(self.huge_series_id, scale.huge_series_episodes, now)
+
+    def _name(self, series_id):
+        name = '{} {} {}'.format(self._random.choice(ADJECTIVES), self._random.choice(NOUNS), series_id)
+        return 'The ' + name if self._random.random() < 0.2 else name
+
+    def _overview(self):
+        return ' '.join(self._random.choice(WORDS) for _ in range(self._random.randint(10, 60)))
+
+    def _episode(self, season, number, air_date):
+        self._next_episode_id += 1
+        return {
+            'id': self._next_episode_id,
+            'airedSeason': season,
+            'airedEpisodeNumber': number,
+            'episodeName': 'Episode {}x{}'.format(season, number),
+            'firstAired': air_date.isoformat(),
+            'overview': self._overview(),
+        }
+
+    def _add_series(self, series_id, num_episodes, now):
+        self.series[series_id] = {
+            'id': series_id,
+            'seriesName': self._name(series_id),
+            'airsTime': self._random.choice(AIR_TIMES),
+            'runtime': self._random.choice(RUNTIMES),
+            # inside the default three day polling window, so a first poll sees every series
+            'lastUpdated': now - self._random.randint(0, 2 * 24 * 3600),
+            'network': self._random.choice(NETWORKS),
+            'banner': 'graphical/{}-g1.jpg'.format(series_id),
+            'overview': self._overview(),
+            'firstAired': None,
+            'status': 'Continuing',
+        }
+        latest = datetime.date.fromtimestamp(now) + datetime.timedelta(days=self._random.randint(*LATEST_EPISODE_DAYS))
+        first = latest - datetime.timedelta(weeks=num_episodes - 1)
+        episodes = []
+        season, number = 1, 0
+        season_length = self._random.randint(8, 22)
+        for index in range(num_episodes):
+            if number == season_length:
+                season, number = season + 1, 0
+                season_length = self._random.randint(8, 22)
+            number += 1
+            episodes.append(self._episode(season, number, first + datetime.timedelta(weeks=index)))
+        self.series[series_id]['firstAired'] = first.isoformat()
+        self.episodes[series_id] = episodes
+
+    def series_ids(self):
+        return [series_id for series_id in self.series if series_id != self.huge_series_id]
+
+    def touch(self, fraction, now=None):
+        # simulates tvdb edits: retitles one episode and adds a new one to a share of the series
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            series_ids = self.series_ids()
+            touched = self._random.sample(series_ids, max(1, int(len(series_ids) * fraction)))
+            for series_id in touched:
+                episodes = self.episodes[series_id]
+                edited = self._random.choice(episodes)
+                edited['episodeName'] = 'Retitled {}'.format(edited['episodeName'])
+                latest = episodes[-1]
+                air_date = datetime.datetime.strptime(latest['firstAired'], '%Y-%m-%d').date()
+                episodes.append(self._episode(
+                    latest['airedSeason'], latest['airedEpisodeNumber'] + 1, air_date + datetime.timedelta(weeks=1),
+                ))
+                self.series[series_id]['lastUpdated'] = now
+        return touched
+
+    def search(self, query):
+        query = query.lower()
+        return [series for series in self.series.values() if query in series['seriesName'].lower()][:100]
+
+    def updated(self, from_time, to_time):
+        with self._lock:
+            return [
+                {'id': series['id'], 'lastUpdated': series['lastUpdated']}
+                for series in self.series.values()
+                if from_time <= series['lastUpdated'] <= to_time
+            ]
+
+    def subscriptions(self, scale, seed=0):
+        # {user name: [series ids]}; the huge series is left out so read benchmarks stay comparable
+        chooser = random.Random(seed)
+        series_ids = self.series_ids()
+        count = min(scale.subscriptions_per_user, len(series_ids))
+        return collections.OrderedDict(
+            ('bench{}'.format(index), chooser.sample(series_ids, count))
+            for index in range(scale.users)
+        )
@@ -0,0 +1,114 @@
+import json
+import re
+import threading
+
+import six.moves.BaseHTTPServer
+import six.moves.socketserver
+import six.moves.urllib.parse
+
+
+PAGE_SIZE = 100
+TOKEN = 'bench-token'
+
+SERIES_PATH = re.compile(r'^/series/(\d+)$')
+EPISODES_PATH = re.compile(r'^/series/(\d+)/episodes$')
+
+
+class _Server(six.moves.socketserver.ThreadingMixIn, six.moves.BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(six.moves.BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive, like the real api, so the client's connection reuse is exercised
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.rstrip('/') == '/login':
+            self._send(200, {'token': TOKEN})
+        else:
+            self._send(404, {'Error': 'Not found'})
+
+    def do_GET(self):
+        # requests are handled on their own threads
+        with self.server.requests_lock:
+            self.server.requests += 1
+        if self.headers.get('Authorization') != 'Bearer {}'.format(TOKEN):
+            self._send(401, {'Error': 'Not authorized'})
+            return
+        url = six.moves.urllib.parse.urlparse(self.path)
+        query = dict(six.moves.urllib.parse.parse_qsl(url.query))
+        catalog = self.server.catalog
+
+        series_match = SERIES_PATH.match(url.path)
+        episodes_match = EPISODES_PATH.match(url.path)
+        if url.path == '/search/series':
+            results = catalog.search(query.get('name', ''))
+            if results:
+                self._send(200, {'data': results})
+            else:
+                self._send(404, {'Error': 'Resource not found'})
+        elif url.path == '/updated/query':
+            from_time = int(query['fromTime'])
+            to_time = int(query.get('toTime', from_time + 7 * 24 * 3600))
+            self._send(200, {'data': catalog.updated(from_time, to_time) or None})
+        elif series_match and int(series_match.group(1)) in catalog.series:
+            self._send(200, {'data': catalog.series[int(series_match.group(1))]})
+        elif episodes_match and int(episodes_match.group(1)) in catalog.episodes:
+            self._send_episodes(catalog.episodes[int(episodes_match.group(1))], int(query.get('page', 1)))
+        else:
+            self._send(404, {'Error': 'Resource not found'})
+
+    def _send_episodes(self, episodes, page):
+        last = max(1, (len(episodes) + PAGE_SIZE - 1) // PAGE_SIZE)
+        if page < 1 or page > last:
+            self._send(404, {'Error': 'No results for your query'})
+            return
+        self._send(200, {
+            'links': {
+                'first': 1,
+                'last': last,
+                'next': page + 1 if page < last else None,
+                'prev': page - 1 if page > 1 else None,
+            },
+            'data': episodes[(page - 1) * PAGE_SIZE:page * PAGE_SIZE],
+        })
+
+
+class FakeTvDb(object):
+    # Serves a Catalog over http on localhost with the endpoints tvdb.api uses.
+    def __init__(self, catalog, port=0):
+        self._server = _Server(('127.0.0.1', port), _Handler)
+        self._server.catalog = catalog
+        self._server.requests = 0
+        self._server.requests_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/'.format(self._server.server_address[1])
+
+    @property
+    def requests(self):
+        with self._server.requests_lock:
+            return self._server.requests
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,340 @@
+"""Reproducible benchmarks against synthetic data and a local fake tvdb server.
+
+    python -m bench.run --scale medium --credentials bench_credentials.json --create-schema --output results.json
+
+The credentials file has the same format as /etc/tvq/credentials and must
+name a scratch database: every tv_queue table in it is emptied, or dropped
+and recreated with --create-schema. Results are json, one entry per timed
+operation with min, median, mean and max seconds, tagged with the git
+revision so runs of different versions can be compared.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import six
+
+from bench.data import SCALES, Catalog
+from bench.fake_tvdb import FakeTvDb
+from tv.db.cache import UnseenCache
+from tv.db.db import ShowDatabase
+from tv.db.pool import ConnectionPool, load_credentials
+from tvdb.api import TvDbApi
+import web.tv_queue
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_FILE = os.path.join(ROOT, 'sql', 'create_tables.sql')
+DEFAULT_CREDENTIALS_FILE = '/etc/tvq/bench_credentials'
+
+# children first, so rows can be deleted without tripping foreign keys
+TABLES = ('seen', 'watermark', 'subscription', 'episode', 'series', 'update_cursor', 'user')
+
+USER_INSERT = 'INSERT INTO user (name) VALUES (%s)'
+SERIES_PLACEHOLDER = 'INSERT INTO series (id, name, last_updated) VALUES (%s, %s, 0)'
+SUBSCRIPTION_INSERT = 'INSERT INTO subscription (user_id, series_id) VALUES (%s, %s)'
+WATERMARK_INSERT = 'INSERT INTO watermark (user_id, series_id) VALUES (%s, %s)'
+SET_WATERMARK = '''
+    UPDATE watermark SET watched_season = %s, watched_episode = %s
+    WHERE user_id = %s AND series_id = %s
+'''
+SEEN_INSERT = 'INSERT INTO seen (user_id, episode_id, watch_time) VALUES (%s, %s, NOW())'
+
+
+@contextlib.contextmanager
+def quiet():
+    # update_series reports every series it touches; keep that out of the results
+    stdout = sys.stdout
+    sys.stdout = six.StringIO()
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+
+
+class Runner(object):
+    def __init__(self, iterations):
+        self._iterations = iterations
+        self.results = []
+
+    def measure(self, name, function, iterations=None, prepare=None):
+        # prepare runs untimed before each iteration and returns the arguments for function
+        timings = []
+        for _ in range(iterations or self._iterations):
+            args = prepare() if prepare is not None else ()
+            if args is None:
+                break
+            start = time.time()
+            with quiet():
+                function(*args)
+            timings.append(time.time() - start)
+        if not timings:
+            return
+        timings.sort()
+        self.results.append({
+            'name': name,
+            'iterations': len(timings),
+            'min': timings[0],
+            'median': timings[len(timings) // 2],
+            'mean': sum(timings) / len(timings),
+            'max': timings[-1],
+            'total': sum(timings),
+        })
+        sys.stderr.write('{:<40} {:>4} x {:>10.2f}ms median\n'.format(name, len(timings), timings[len(timings) // 2] * 1000))
+
+
+def revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset_database(connection, create_schema):
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW TABLES LIKE 'user'")
+        if cursor.fetchone():
+            cursor.execute("SELECT COUNT(*) FROM user WHERE name NOT LIKE 'bench%'")
+            if cursor.fetchone()[0]:
+                raise SystemExit('refusing to wipe a database with real users; point --credentials at a scratch database')
+        if create_schema:
+            for table in TABLES:
+                cursor.execute('DROP TABLE IF EXISTS `{}`'.format(table))
+            with open(SCHEMA_FILE) as schema_fobj:
+                statements = schema_fobj.read().split(';')
+            for statement in statements:
+                # the schema file selects the production database; stay on the configured one
+                if statement.strip() and not statement.strip().upper().startswith('USE '):
+                    cursor.execute(statement)
+        else:
+            for table in TABLES:
+                cursor.execute('DELETE FROM `{}`'.format(table))
+    connection.commit()
+
+
+def seed_subscriptions(connection, catalog, subscriptions):
+    user_ids = {}
+    with connection.cursor() as cursor:
+        for name, series_ids in subscriptions.items():
+            cursor.execute(USER_INSERT, (name,))
+            user_ids[name] = cursor.lastrowid
+        # the huge series is left for update_series to load on its own
+        cursor.executemany(SERIES_PLACEHOLDER, [
+            (series_id, catalog.series[series_id]['seriesName'][:50]) for series_id in catalog.series_ids()
+        ])
+        subscribed = [
+            (user_ids[name], series_id) for name, series_ids in subscriptions.items() for series_id in series_ids
+        ]
+        cursor.executemany(SUBSCRIPTION_INSERT, subscribed)
+        cursor.executemany(WATERMARK_INSERT, subscribed)
+    connection.commit()
+    return user_ids
+
+
+def seed_history(connection, catalog, scale, user_ids, subscriptions, seed):
+    # watched in order up to a watermark, plus a few episodes further on watched out of order
+    chooser = random.Random(seed)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT series_id, season, episode, id FROM episode')
+        episode_ids = {row[:3]: row[3] for row in cursor.fetchall()}
+        watermarks = []
+        seen = []
+        for name, series_ids in subscriptions.items():
+            for series_id in series_ids:
+                episodes = [(episode['airedSeason'], episode['airedEpisodeNumber']) for episode in catalog.episodes[series_id]]
+                cut = int(len(episodes) * scale.watched_fraction)
+                if cut:
+                    watermarks.append(episodes[cut - 1] + (user_ids[name], series_id))
+                later = episodes[cut + 1:]
+                for key in chooser.sample(later, int(len(later) * scale.out_of_order_fraction)):
+                    seen.append((user_ids[name], episode_ids[(series_id,) + key]))
+        cursor.executemany(SET_WATERMARK, watermarks)
+        cursor.executemany(SEEN_INSERT, seen)
+    connection.commit()
+    return len(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tv_queue against synthetic data and a fake tvdb server")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="Size of the synthetic data set")
+    parser.add_argument('--users', type=int, help="Override the number of users for the scale")
+    parser.add_argument('--series', type=int, help="Override the number of series for the scale")
+    parser.add_argument('--episodes-per-series', type=int, help="Override the episodes per series for the scale")
+    parser.add_argument('--huge-series-episodes', type=int, help="Override the size of the huge series")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument('--iterations', type=int, default=20, help="Repetitions of each read benchmark")
+    parser.add_argument('--workers', type=int, default=4, help="update_all_series workers")
+    parser.add_argument(
+        '--credentials', default=DEFAULT_CREDENTIALS_FILE,
+        help="Connection settings for a scratch database; all of its tv_queue tables are emptied",
+    )
+    parser.add_argument('--create-schema', action='store_true', help="Drop and recreate the tables from sql/create_tables.sql")
+    parser.add_argument('--label', help="Free-form label stored with the results, like a branch name")
+    parser.add_argument('--output', help="Write the json results here instead of stdout")
+    args = parser.parse_args()
+
+    overrides = {
+        field: getattr(args, field)
+        for field in ('users', 'series', 'episodes_per_series', 'huge_series_episodes')
+        if getattr(args, field) is not None
+    }
+    scale = SCALES[args.scale]._replace(**overrides)
+    credentials = load_credentials(args.credentials)
+    started = datetime.datetime.utcnow()
+    catalog = Catalog(scale, seed=args.seed)
+    subscriptions = catalog.subscriptions(scale, seed=args.seed)
+    fake_tvdb = FakeTvDb(catalog).start()
+    pool = ConnectionPool(max_size=args.workers + 2, credentials=credentials)
+    runner = Runner(args.iterations)
+    try:
+        seen_rows = run(runner, args, scale, catalog, subscriptions, fake_tvdb, pool)
+    finally:
+        pool.close()
+        fake_tvdb.stop()
+
+    report = {
+        'revision': revision(),
+        'label': args.label,
+        'started': started.isoformat() + 'Z',
+        'python': platform.python_version(),
+        'scale': args.scale,
+        'parameters': dict(scale._asdict(), seed=args.seed, workers=args.workers),
+        'data': {
+            'series': len(catalog.series),
+            'episodes': sum(len(episodes) for episodes in catalog.episodes.values()),
+            'subscriptions': sum(len(series_ids) for series_ids in subscriptions.values()),
+            'out_of_order_seen': seen_rows,
+        },
+        'tvdb_requests': fake_tvdb.requests,
+        'results': runner.results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_fobj:
+            json.dump(report, output_fobj, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+
+def run(runner, args, scale, catalog, subscriptions, fake_tvdb, pool):
+    connection = pool.acquire()
+    try:
+        reset_database(connection, args.create_schema)
+        user_ids = seed_subscriptions(connection, catalog, subscriptions)
+    finally:
+        pool.release(connection)
+
+    api = TvDbApi('bench', api_url=fake_tvdb.url, token_file=None)
+    cache = UnseenCache()
+
+    def update_all():
+        show_db = ShowDatabase(api=api, pool=pool, cache=cache)
+        try:
+            show_db.update_all_series(workers=args.workers, requests_per_second=1000000)
+        finally:
+            show_db.close()
+
+    def touch_and_rewind():
+        catalog.touch(0.1)
+        # start polling from the default window again, so the touched series are picked up
+        connection = pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM update_cursor')
+            connection.commit()
+        finally:
+            pool.release(connection)
+        return ()
+
+    runner.measure('update_all_series.initial', update_all, iterations=1)
+    runner.measure('update_all_series.incremental', update_all, iterations=3, prepare=touch_and_rewind)
+
+    def update_huge(force):
+        show_db = ShowDatabase(api=api, pool=pool, cache=cache)
+        try:
+            show_db.update_series(catalog.huge_series_id, force=force)
+        finally:
+            show_db.close()
+
+    runner.measure('update_series.huge.initial', update_huge, iterations=1, prepare=lambda: (False,))
+    runner.measure('update_series.huge.unchanged', update_huge, iterations=3, prepare=lambda: (True,))
+
+    connection = pool.acquire()
+    try:
+        seen_rows = seed_history(connection, catalog, scale, user_ids, subscriptions, args.seed)
+    finally:
+        pool.release(connection)
+
+    uids = list(user_ids.values())
+    chooser = random.Random(args.seed)
+
+    def read(method, cold):
+        # a fresh instance per call, as the web app makes one per request
+        def call(uid):
+            show_db = ShowDatabase(api=False, pool=pool, cache=cache)
+            try:
+                if cold:
+                    show_db.clear_cache()
+                method(show_db, uid)
+            finally:
+                show_db.close()
+        return call
+
+    def next_uid():
+        return (chooser.choice(uids),)
+
+    runner.measure('get_queued_by_series.cold', read(ShowDatabase.get_queued_by_series, True), prepare=next_uid)
+    runner.measure('get_queued_by_series.warm', read(ShowDatabase.get_queued_by_series, False), prepare=next_uid)
+    runner.measure('get_preview.cold', read(lambda db, uid: db.get_preview(uid, days=7), True), prepare=next_uid)
+    runner.measure('get_preview.warm', read(lambda db, uid: db.get_preview(uid, days=7), False), prepare=next_uid)
+
+    def pick_watch_until():
+        # a queued episode past the first of its series, so the watermark really moves
+        show_db = ShowDatabase(api=False, pool=pool, cache=cache)
+        try:
+            for uid in chooser.sample(uids, len(uids)):
+                candidates = [series for series in show_db.get_queued_by_series(uid) if series['num_episodes'] > 1]
+                if candidates:
+                    series = chooser.choice(candidates)
+                    return uid, chooser.choice(series['episodes'][1:]).episode_id
+        finally:
+            show_db.close()
+        return None
+
+    def watch_until(uid, episode_id):
+        show_db = ShowDatabase(api=False, pool=pool, cache=cache)
+        try:
+            show_db.watch_until(uid, episode_id)
+        finally:
+            show_db.close()
+
+    runner.measure('watch_until', watch_until, prepare=pick_watch_until)
+
+    web.tv_queue.POOL = pool
+    client = web.tv_queue.app.test_client()
+
+    def get_page(path, cold):
+        def call(uid):
+            if cold:
+                web.tv_queue.UNSEEN_CACHE.clear()
+            response = client.get(path, headers={'Cookie': 'uid={}'.format(uid)})
+            if response.status_code != 200:
+                raise RuntimeError('{} answered {}'.format(path, response.status_code))
+        return call
+
+    runner.measure('http./queue.cold', get_page('/queue', True), prepare=next_uid)
+    runner.measure('http./queue.warm', get_page('/queue', False), prepare=next_uid)
+    runner.measure('http./preview.cold', get_page('/preview', True), prepare=next_uid)
+    runner.measure('http./preview.warm', get_page('/preview', False), prepare=next_uid)
+    return seen_rows
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ USE tvq;
 CREATE TABLE `user` (
   `id` bigint(20) unsigned NOT NULL AUTO_INCREMENT,
   `name` varchar(20) NOT NULL DEFAULT '',
+  `data_version` bigint(20) unsigned NOT NULL DEFAULT '0',
   PRIMARY KEY (`id`),
   UNIQUE KEY `name` (`name`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
@@ -15,17 +16,23 @@ CREATE TABLE `series` (
   `last_updated` bigint(20) NOT NULL,
   `network` varchar(20) DEFAULT NULL,
   `banner` varchar(50) DEFAULT NULL,
-  PRIMARY KEY (`id`)
+  `search_name` varchar(50) NOT NULL DEFAULT '',
+  `update_failures` tinyint(3) unsigned NOT NULL DEFAULT '0',
+  `overview` text,
+  PRIMARY KEY (`id`),
+  KEY `search_prefix` (`search_name`),
+  FULLTEXT KEY `search_text` (`search_name`, `network`)
 ) ENGINE=InnoDB AUTO_INCREMENT=1 DEFAULT CHARSET=utf8;
 
 CREATE TABLE `episode` (
-  `id` bigint(20) unsigned NOT NULL,
+  `id` bigint(20) unsigned NOT NULL AUTO_INCREMENT,
   `series_id` bigint(20) unsigned NOT NULL,
   `season` int(11) NOT NULL,
   `episode` int(11) NOT NULL,
   `title` varchar(50) DEFAULT '',
   `air_date` date DEFAULT NULL,
   `overview` text,
+  `content_hash` char(40) DEFAULT NULL,
   PRIMARY KEY (`id`),
   UNIQUE KEY `show_season_episode` (`series_id`,`season`,`episode`),
   KEY `fk_show_id` (`series_id`),
@@ -46,14 +53,31 @@ CREATE TABLE `subscription` (
   CONSTRAINT `subscription_ibfk_3` FOREIGN KEY (`user_id`) REFERENCES `user` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=94 DEFAULT CHARSET=utf8;
 
+CREATE TABLE `watermark` (
+  `user_id` bigint(20) unsigned NOT NULL,
+  `series_id` bigint(20) unsigned NOT NULL,
+  `watched_season` int(11) NOT NULL DEFAULT '-1',
+  `watched_episode` int(11) NOT NULL DEFAULT '-1',
+  PRIMARY KEY (`user_id`,`series_id`),
+  KEY `series_id` (`series_id`),
+  CONSTRAINT `watermark_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `user` (`id`) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT `watermark_ibfk_2` FOREIGN KEY (`series_id`) REFERENCES `series` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 CREATE TABLE `seen` (
   `id` bigint(20) unsigned NOT NULL AUTO_INCREMENT,
   `user_id` bigint(20) unsigned NOT NULL,
   `episode_id` bigint(20) unsigned NOT NULL,
   `watch_time` datetime DEFAULT NULL,
   PRIMARY KEY (`id`),
-  KEY `user_id` (`user_id`),
+  UNIQUE KEY `user_episode` (`user_id`,`episode_id`),
   KEY `episode_id` (`episode_id`),
   CONSTRAINT `seen_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `user` (`id`) ON DELETE CASCADE ON UPDATE CASCADE,
   CONSTRAINT `seen_ibfk_2` FOREIGN KEY (`episode_id`) REFERENCES `episode` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE `update_cursor` (
+  `id` tinyint(3) unsigned NOT NULL,
+  `last_poll` bigint(20) NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -0,0 +1,4 @@
+-- Consecutive failed loads of a series from tvdb, cleared by the next
+-- successful load. update_series.py retries placeholders and failed series
+-- on every run until MAX_UPDATE_FAILURES in a row.
+ALTER TABLE `series` ADD COLUMN `update_failures` TINYINT UNSIGNED NOT NULL DEFAULT 0;
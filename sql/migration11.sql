@@ -0,0 +1,3 @@
+-- Series overviews so /search can show local results like tvdb's. Existing
+-- series fill theirs in on their next refresh.
+ALTER TABLE `series` ADD COLUMN `overview` TEXT;
@@ -0,0 +1,91 @@
+-- Every episode up to (watched_season, watched_episode) counts as seen, so
+-- seen only needs rows for episodes watched out of order. Watermarks are kept
+-- apart from subscriptions so unsubscribing does not forget what was watched.
+CREATE TABLE `watermark` (
+  `user_id` bigint(20) unsigned NOT NULL,
+  `series_id` bigint(20) unsigned NOT NULL,
+  `watched_season` int(11) NOT NULL DEFAULT '-1',
+  `watched_episode` int(11) NOT NULL DEFAULT '-1',
+  PRIMARY KEY (`user_id`,`series_id`),
+  KEY `series_id` (`series_id`),
+  CONSTRAINT `watermark_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `user` (`id`) ON DELETE CASCADE ON UPDATE CASCADE,
+  CONSTRAINT `watermark_ibfk_2` FOREIGN KEY (`series_id`) REFERENCES `series` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+INSERT INTO watermark (user_id, series_id)
+SELECT user_id, series_id FROM subscription;
+
+DELETE newer FROM
+    seen AS newer
+    JOIN seen AS older ON
+        newer.user_id = older.user_id
+        AND newer.episode_id = older.episode_id
+        AND newer.id > older.id;
+
+ALTER TABLE `seen` ADD UNIQUE KEY `user_episode` (`user_id`, `episode_id`);
+ALTER TABLE `seen` DROP KEY `user_id`;
+
+-- The watermark sits just before the first unseen episode of each series.
+CREATE TEMPORARY TABLE first_unseen_season AS
+SELECT watermark.user_id, watermark.series_id, MIN(episode.season) AS season
+FROM
+    watermark
+    JOIN episode USING(series_id)
+    LEFT JOIN seen ON
+        episode.id = seen.episode_id
+        AND seen.user_id = watermark.user_id
+WHERE seen.id IS NULL
+GROUP BY watermark.user_id, watermark.series_id;
+
+CREATE TEMPORARY TABLE first_unseen AS
+SELECT first_unseen_season.user_id, first_unseen_season.series_id, first_unseen_season.season, MIN(episode.episode) AS episode
+FROM
+    first_unseen_season
+    JOIN episode ON
+        episode.series_id = first_unseen_season.series_id
+        AND episode.season = first_unseen_season.season
+    LEFT JOIN seen ON
+        episode.id = seen.episode_id
+        AND seen.user_id = first_unseen_season.user_id
+WHERE seen.id IS NULL
+GROUP BY first_unseen_season.user_id, first_unseen_season.series_id, first_unseen_season.season;
+
+UPDATE
+    watermark
+    JOIN first_unseen USING(user_id, series_id)
+SET
+    watermark.watched_season = first_unseen.season,
+    watermark.watched_episode = first_unseen.episode - 1;
+
+-- Series with nothing left unseen are watched through their last episode.
+CREATE TEMPORARY TABLE last_season AS
+SELECT series_id, MAX(season) AS season
+FROM episode
+GROUP BY series_id;
+
+CREATE TEMPORARY TABLE last_episode AS
+SELECT last_season.series_id, last_season.season, MAX(episode.episode) AS episode
+FROM
+    last_season
+    JOIN episode USING(series_id, season)
+GROUP BY last_season.series_id, last_season.season;
+
+UPDATE
+    watermark
+    JOIN last_episode USING(series_id)
+    LEFT JOIN first_unseen USING(user_id, series_id)
+SET
+    watermark.watched_season = last_episode.season,
+    watermark.watched_episode = last_episode.episode
+WHERE first_unseen.user_id IS NULL;
+
+-- Drop the seen rows the watermarks now cover.
+DELETE seen FROM
+    seen
+    JOIN episode ON episode.id = seen.episode_id
+    JOIN watermark ON
+        watermark.user_id = seen.user_id
+        AND watermark.series_id = episode.series_id
+WHERE (episode.season, episode.episode) <= (watermark.watched_season, watermark.watched_episode);
+
+DROP TEMPORARY TABLE first_unseen_season, first_unseen, last_season, last_episode;
@@ -0,0 +1,5 @@
+CREATE TABLE `update_cursor` (
+  `id` tinyint(3) unsigned NOT NULL,
+  `last_poll` bigint(20) NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -0,0 +1,3 @@
+-- sha1 of an episode's title, air date and overview, used to skip rewriting unchanged rows;
+-- existing rows start out NULL and are rewritten once on their next refresh
+ALTER TABLE `episode` ADD COLUMN `content_hash` CHAR(40) DEFAULT NULL;
@@ -0,0 +1 @@
+ALTER TABLE `user` ADD COLUMN `data_version` BIGINT UNSIGNED NOT NULL DEFAULT 0;
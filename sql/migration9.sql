@@ -0,0 +1,17 @@
+-- Series names as _sorting_key normalises them (upper case, no leading article),
+-- indexed for /search. Placeholders are filled in on their first refresh.
+ALTER TABLE `series` ADD COLUMN `search_name` VARCHAR(50) NOT NULL DEFAULT '';
+
+-- Mirrors _search_name: whitespace runs become single spaces, the ends are
+-- trimmed, and then A, AN and THE are stripped in that order. Names are at
+-- most 50 characters, so six passes collapse any run of spaces.
+UPDATE series SET search_name = REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(name, '\t', ' '), '\n', ' '), '\r', ' '), CHAR(12), ' '), CHAR(11), ' ');
+UPDATE series SET search_name =
+    UPPER(TRIM(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(search_name, '  ', ' '), '  ', ' '), '  ', ' '), '  ', ' '), '  ', ' '), '  ', ' ')));
+UPDATE series SET search_name = SUBSTRING(search_name, 3) WHERE search_name LIKE 'A %';
+UPDATE series SET search_name = SUBSTRING(search_name, 4) WHERE search_name LIKE 'AN %';
+UPDATE series SET search_name = SUBSTRING(search_name, 5) WHERE search_name LIKE 'THE %';
+UPDATE series SET search_name = LEFT(search_name, 50);
+
+ALTER TABLE `series` ADD KEY `search_prefix` (`search_name`);
+ALTER TABLE `series` ADD FULLTEXT KEY `search_text` (`search_name`, `network`);
@@ -0,0 +1,118 @@
+import collections
+import threading
+import time
+
+from tv.db.unseen import UnseenEpisodes
+
+
+DEFAULT_MAX_USERS = 1000
+DEFAULT_MAX_ROWS = 200000
+
+
+def _num_rows(value):
+    return len(value) if isinstance(value, UnseenEpisodes) else 1
+
+
+class UnseenCache(object):
+    def __init__(self, max_users=DEFAULT_MAX_USERS, max_rows=DEFAULT_MAX_ROWS, max_age_seconds=None):
+        self._max_users = max_users
+        self._max_rows = max_rows
+        self._max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        # uid -> {key: (value, stored_at, since, expires)}, least recently used user first;
+        # a value is valid for times from since until expires
+        self._entries = collections.OrderedDict()
+        self._num_rows = 0
+        # bumped on every write for a user so loads that raced a write are not stored
+        self._generations = collections.defaultdict(int)
+        # the user's data_version the cached views were loaded under
+        self._versions = {}
+
+    def _pop_user(self, uid):
+        views = self._entries.pop(uid)
+        self._num_rows -= sum(_num_rows(value) for value, _, _, _ in views.values())
+
+    def _drop_user(self, uid):
+        self._generations[uid] += 1
+        if uid in self._entries:
+            self._pop_user(uid)
+
+    def _pop_view(self, uid, key):
+        value, _, _, _ = self._entries[uid].pop(key)
+        self._num_rows -= _num_rows(value)
+
+    def generation(self, uid):
+        with self._lock:
+            return self._generations[uid]
+
+    def get(self, uid, key, now):
+        with self._lock:
+            if uid not in self._entries or key not in self._entries[uid]:
+                return None
+            value, stored_at, since, expires = self._entries[uid][key]
+            if since is not None and now < since:
+                # loaded for a later time, which says nothing about this one
+                return None
+            expired = (
+                (expires is not None and now >= expires) or
+                (self._max_age_seconds is not None and time.time() - stored_at > self._max_age_seconds)
+            )
+            if expired:
+                self._pop_view(uid, key)
+                return None
+            self._entries[uid] = self._entries.pop(uid)
+            return value
+
+    def put(self, uid, key, value, generation, expires=None, since=None):
+        with self._lock:
+            if self._generations[uid] != generation or _num_rows(value) > self._max_rows:
+                return
+            views = self._entries.pop(uid, {})
+            self._entries[uid] = views
+            if key in views:
+                self._pop_view(uid, key)
+            views[key] = (value, time.time(), since, expires)
+            self._num_rows += _num_rows(value)
+            while len(self._entries) > self._max_users or self._num_rows > self._max_rows:
+                self._pop_user(next(iter(self._entries)))
+
+    def sync_version(self, uid, version):
+        # a version we did not see coming means another process wrote for this user
+        with self._lock:
+            if self._versions.get(uid) != version:
+                self._drop_user(uid)
+                self._versions[uid] = version
+
+    def invalidate(self, *uids):
+        with self._lock:
+            for uid in uids:
+                self._drop_user(uid)
+                self._versions.pop(uid, None)
+
+    def discard(self, uid, predicate, version=None):
+        # Unseen episodes are replaced by a copy without the removed rows when
+        # the write that removed them is the only one since they were loaded;
+        # anything else is dropped. predicate gets (episode_id, series_id, season, episode).
+        with self._lock:
+            previous_version = self._versions.get(uid)
+            self._versions[uid] = version
+            if version is None or previous_version is None or previous_version != version - 1:
+                self._drop_user(uid)
+                return
+            self._generations[uid] += 1
+            views = self._entries.get(uid, {})
+            for key, (value, stored_at, since, expires) in list(views.items()):
+                if isinstance(value, UnseenEpisodes):
+                    kept = value.without(predicate)
+                    views[key] = (kept, stored_at, since, expires)
+                    self._num_rows -= len(value) - len(kept)
+                else:
+                    self._pop_view(uid, key)
+
+    def clear(self):
+        with self._lock:
+            for uid in self._entries:
+                self._generations[uid] += 1
+            self._entries.clear()
+            self._versions.clear()
+            self._num_rows = 0
@@ -1,31 +1,156 @@
 import collections
 import datetime
+import hashlib
 import json
+import re
+import threading
+import time
 
 import pymysql
+import pymysql.cursors
+import six.moves.queue
 
+from tv import metrics
+from tv.db.cache import UnseenCache
+from tv.db.pool import connect, load_credentials
+from tv.db.unseen import UnseenEpisodes, to_timestamp
 import tvdb.api
 
 
-_CREDENTIALS_FILE = '/etc/tvq/credentials'
+DELETE_EPISODES = '''
+    DELETE FROM episode WHERE id IN ({})
+'''
 
+UPSERT_BATCH_SIZE = 500
 
-DELETE_EPISODE = '''
-    DELETE FROM episode WHERE id = %s
-'''
+SERIES_FIELDS = (
+    'id',
+    'name',
+    'air_time',
+    'episode_length',
+    'last_updated',
+    'network',
+    'banner',
+    'search_name',
+    'update_failures',
+    'overview',
+)
+SERIES_KEYS = ('id',)
+
+EPISODE_FIELDS = ('series_id', 'season', 'episode', 'title', 'air_date', 'overview', 'content_hash')
+EPISODE_KEYS = ('series_id', 'season', 'episode')
 
 SUBSCRIPTION_INSERT = 'INSERT INTO subscription (user_id, series_id) VALUES (%s, %s)'
 
-WATCH = 'INSERT INTO seen (user_id, episode_id, watch_time) VALUES (%s, %s, NOW())'
+# watermarks outlive subscriptions, so resubscribing keeps what was already watched
+WATERMARK_INSERT = '''
+    INSERT INTO watermark (user_id, series_id) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE user_id = user_id
+'''
 
-GET_EPISODE_DATA = 'SELECT series_id, season, episode FROM episode WHERE id = %s'
-EPISODES_UNTIL = '''
-    SELECT id FROM episode
+# stands in for a series until update_series fills it in; last_updated 0 never matches tvdb
+SERIES_PLACEHOLDER = '''
+    INSERT INTO series (id, name, last_updated) VALUES (%s, %s, 0)
+    ON DUPLICATE KEY UPDATE id = id
+'''
+
+# seen only holds episodes watched past the series' watermark; episode ids are filled in per batch
+WATCH_MANY = '''
+    INSERT INTO seen (user_id, episode_id, watch_time)
+    SELECT %s, episode.id, NOW()
+    FROM
+        episode
+        LEFT JOIN watermark ON
+            watermark.user_id = %s
+            AND watermark.series_id = episode.series_id
     WHERE
-        series_id = %s AND (
-            season < %s OR
-            (season = %s AND episode <= %s)
+        episode.id IN ({})
+        AND (
+            watermark.user_id IS NULL
+            OR (episode.season, episode.episode) > (watermark.watched_season, watermark.watched_episode)
         )
+    ON DUPLICATE KEY UPDATE seen.id = seen.id
+'''
+WATCH = WATCH_MANY.format('%s')
+
+GET_EPISODE_DATA = 'SELECT series_id, season, episode FROM episode WHERE id = %s'
+GET_EPISODES_DATA = 'SELECT id, series_id, season, episode FROM episode WHERE id IN ({})'
+
+WATCH_ACTION = 'watch'
+WATCH_UNTIL_ACTION = 'watch_until'
+GET_OVERVIEW = 'SELECT overview FROM episode WHERE id = %s'
+
+GET_WATERMARK = '''
+    SELECT watched_season, watched_episode FROM watermark
+    WHERE user_id = %s AND series_id = %s
+'''
+
+SET_WATERMARK = '''
+    UPDATE watermark
+    SET watched_season = %s, watched_episode = %s
+    WHERE
+        user_id = %s
+        AND series_id = %s
+        AND (watched_season, watched_episode) < (%s, %s)
+'''
+
+DELETE_SEEN_UNTIL = '''
+    DELETE seen FROM seen JOIN episode ON episode.id = seen.episode_id
+    WHERE
+        seen.user_id = %s
+        AND episode.series_id = %s
+        AND (episode.season, episode.episode) <= (%s, %s)
+'''
+
+# Specials are ordered like any other episodes, so an unwatched season 0 episode
+# holds the watermark back and everything watched after it keeps its seen row.
+# That only costs space; leaving specials out here would mark them seen.
+FIRST_UNSEEN_AFTER = '''
+    SELECT episode.season, episode.episode
+    FROM
+        episode
+        LEFT JOIN seen ON
+            seen.episode_id = episode.id
+            AND seen.user_id = %s
+    WHERE
+        episode.series_id = %s
+        AND (episode.season, episode.episode) > (%s, %s)
+        AND seen.id IS NULL
+    ORDER BY episode.season, episode.episode
+    LIMIT 1
+'''
+
+LAST_EPISODE = '''
+    SELECT season, episode FROM episode
+    WHERE series_id = %s
+    ORDER BY season DESC, episode DESC
+    LIMIT 1
+'''
+
+# targets are a derived table of (series_id, season, episode) rows
+SET_WATERMARKS = '''
+    UPDATE watermark JOIN ({}) AS target ON target.series_id = watermark.series_id
+    SET
+        watermark.watched_season = target.season,
+        watermark.watched_episode = target.episode
+    WHERE
+        watermark.user_id = %s
+        AND (watermark.watched_season, watermark.watched_episode) < (target.season, target.episode)
+'''
+WATERMARK_TARGET = 'SELECT %s AS series_id, %s AS season, %s AS episode'
+
+DELETE_SEEN_UNDER_WATERMARKS = '''
+    DELETE seen
+    FROM
+        seen
+        JOIN episode ON episode.id = seen.episode_id
+        JOIN watermark ON
+            watermark.series_id = episode.series_id
+            AND watermark.user_id = seen.user_id
+    WHERE
+        seen.user_id = %s
+        AND episode.series_id IN ({})
+        AND (episode.season, episode.episode) <= (watermark.watched_season, watermark.watched_episode)
 '''
 
 UPDATE_SUBSCRIPTION = '''
@@ -43,6 +168,64 @@ GET_SUBSCRIPTION_DATA = '''
     ORDER BY name
 '''
 
+# subscriptions restored by import keep their settings; an existing subscription takes them over
+IMPORT_SUBSCRIPTION = '''
+    INSERT INTO subscription (user_id, series_id, shift_len, shift_type, enabled) VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        shift_len = VALUES(shift_len),
+        shift_type = VALUES(shift_type),
+        enabled = VALUES(enabled)
+'''
+
+GET_PLACEHOLDER_SERIES = 'SELECT id FROM series WHERE last_updated = 0 AND id IN ({})'
+
+GET_SERIES_STATE = 'SELECT last_updated, update_failures FROM series WHERE id = %s'
+MARK_UPDATE_FAILED = 'UPDATE series SET update_failures = LEAST(update_failures + 1, %s) WHERE id = %s'
+# series whose last load failed or never ran, retried by every update_all_series until
+# they fail MAX_UPDATE_FAILURES times in a row, like ids tvdb does not know
+GET_RETRY_SERIES = '''
+    SELECT id FROM series WHERE (last_updated = 0 OR update_failures > 0) AND update_failures < %s
+'''
+
+# everything up to a watermark counts as seen but has no watch time
+EXPORT_SEEN = '''
+    SELECT episode.series_id, episode.season, episode.episode, NULL
+    FROM
+        watermark
+        JOIN episode USING(series_id)
+    WHERE
+        watermark.user_id = %s
+        AND (episode.season, episode.episode) <= (watermark.watched_season, watermark.watched_episode)
+    UNION ALL
+    SELECT episode.series_id, episode.season, episode.episode, seen.watch_time
+    FROM
+        seen
+        JOIN episode ON episode.id = seen.episode_id
+    WHERE seen.user_id = %s
+    ORDER BY 1, 2, 3
+'''
+
+# covered is true for episodes the user's watermark already counts as seen
+RESOLVE_EPISODES = '''
+    SELECT
+        episode.series_id,
+        episode.season,
+        episode.episode,
+        episode.id,
+        (episode.season, episode.episode) <= (watermark.watched_season, watermark.watched_episode) AS covered
+    FROM
+        episode
+        LEFT JOIN watermark ON
+            watermark.user_id = %s
+            AND watermark.series_id = episode.series_id
+    WHERE (episode.series_id, episode.season, episode.episode) IN ({})
+'''
+
+IMPORT_SEEN = '''
+    INSERT INTO seen (user_id, episode_id, watch_time) VALUES {}
+    ON DUPLICATE KEY UPDATE id = id
+'''
+
 Subscription = collections.namedtuple('Subscription', (
     'series_id',
     'name',
@@ -54,34 +237,92 @@ Subscription = collections.namedtuple('Subscription', (
     'network',
 ))
 
-GET_UNSEEN = '''
-    SELECT
-        episode.id,
-        title,
-        overview,
-        banner,
-        name,
-        series.id,
-        season,
-        episode,
-        air_date,
-        air_time,
-        episode_length,
-        shift_len,
-        shift_type
+# air time of an episode after applying the subscription's time shift
+START_TIME = '''(
+    TIMESTAMP(episode.air_date, COALESCE(series.air_time, '00:00:00'))
+    + INTERVAL (IF(subscription.shift_type = 'DAYS', 24, 1) * subscription.shift_len) HOUR
+)'''
+END_TIME = '({} + INTERVAL COALESCE(series.episode_length, 0) MINUTE)'.format(START_TIME)
+
+UNSEEN_FROM = '''
     FROM
         subscription
         JOIN episode USING(series_id)
         JOIN series ON series.id = subscription.series_id
+        JOIN watermark ON
+            watermark.user_id = subscription.user_id
+            AND watermark.series_id = subscription.series_id
         LEFT JOIN seen ON
             episode.id = episode_id
             AND seen.user_id = subscription.user_id
     WHERE
         subscription.enabled
         AND subscription.user_id = %s
+        AND (episode.season, episode.episode) > (watermark.watched_season, watermark.watched_episode)
         AND seen.id IS NULL
 '''
 
+# unseen episodes with their shifted start and end as timestamps, see tv.db.unseen
+UNSEEN_COLUMNS = '''
+    SELECT
+        episode.id,
+        title,
+        series.id,
+        name,
+        banner,
+        season,
+        episode,
+        TIMESTAMPDIFF(SECOND, '1970-01-01', {start}) AS start_time,
+        TIMESTAMPDIFF(SECOND, '1970-01-01', {end}) AS end_time
+'''.format(start=START_TIME, end=END_TIME)
+
+GET_QUEUED = '''
+    {columns}
+    {unseen}
+        AND {start} <= %s
+    ORDER BY start_time
+'''.format(columns=UNSEEN_COLUMNS, unseen=UNSEEN_FROM, start=START_TIME)
+
+# what the preview shows: episodes still recording plus those starting before the window ends
+GET_SCHEDULED = '''
+    {columns}
+    {unseen}
+        AND {end} > %s
+        AND {start} < %s
+    ORDER BY start_time
+'''.format(columns=UNSEEN_COLUMNS, unseen=UNSEEN_FROM, start=START_TIME, end=END_TIME)
+
+# navbar counts plus the next moment any time-based view of the user's unseen episodes changes
+GET_UNSEEN_SUMMARY = '''
+    SELECT
+        COALESCE(SUM({start} <= %s), 0),
+        COALESCE(SUM({start} <= %s AND {end} > %s), 0),
+        MIN(IF({start} > %s, {start}, NULL)),
+        MIN(IF({start} <= %s AND {end} > %s, {end}, NULL))
+    {unseen}
+'''.format(start=START_TIME, end=END_TIME, unseen=UNSEEN_FROM)
+
+# series someone has subscribed to, matched on the normalised name as a prefix or on
+# whole words of name and network; placeholders not yet loaded from tvdb are left out
+SEARCH_SERIES = '''
+    SELECT id, name, network, banner, overview
+    FROM series
+    WHERE
+        last_updated > 0
+        AND (search_name LIKE %s OR MATCH(search_name, network) AGAINST (%s IN BOOLEAN MODE))
+    ORDER BY search_name LIKE %s DESC, MATCH(search_name, network) AGAINST (%s IN BOOLEAN MODE) DESC, search_name
+    LIMIT %s
+'''
+
+MIN_SEARCH_WORD = 3
+# INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD, plus AND, which the MyISAM and
+# many custom stopword lists have; a required stopword would never match
+SEARCH_STOPWORDS = frozenset((
+    'A', 'ABOUT', 'AN', 'AND', 'ARE', 'AS', 'AT', 'BE', 'BY', 'COM', 'DE', 'EN', 'FOR', 'FROM', 'HOW', 'I', 'IN',
+    'IS', 'IT', 'LA', 'OF', 'ON', 'OR', 'THAT', 'THE', 'THIS', 'TO', 'UND', 'WAS', 'WHAT', 'WHEN', 'WHERE', 'WHO',
+    'WILL', 'WITH', 'WWW',
+))
+
 TIME_PATTERNS = (
     '%I:%M %p',
     '%I:%M%p',
@@ -90,43 +331,57 @@ TIME_PATTERNS = (
     '%I %p',
 )
 
-Unseen = collections.namedtuple('Unseen', (
-    'episode_id',
-    'episode_title',
-    'overview',
-    'series_banner',
-    'series_name',
-    'series_id',
-    'season',
-    'episode',
-    'air_date',
-    'air_time',
-    'episode_length',
-    'shift_len',
-    'shift_type',
+UnseenSummary = collections.namedtuple('UnseenSummary', (
+    'num_queued',
+    'num_recording',
+    'next_change',
+))
+
+SeriesUpdate = collections.namedtuple('SeriesUpdate', (
+    'name',
+    'inserted',
+    'changed',
+    'unchanged',
+    'deleted',
 ))
 
 IGNORED_SORTING_WORDS = ['A', 'AN', 'THE']
 
-SEASON_KEY = 'airedSeason'
-EPISODE_KEY = 'airedEpisodeNumber'
+DEFAULT_REQUESTS_PER_SECOND = 10
+
+MAX_UPDATE_FAILURES = 5
 
-def make_unseen(row):
-    start = Unseen(*row)
-    if start.shift_type == 'HOURS':
-        shift = datetime.timedelta(hours=start.shift_len)
-    elif start.shift_type == 'DAYS':
-        shift = datetime.timedelta(days=start.shift_len)
-    air_time = datetime.datetime.combine(start.air_date, datetime.time()) + start.air_time + shift
-    return start._replace(air_time=air_time.time(), air_date=air_time.date())
+# bumped whenever anything a user's pages show may have changed
+GET_DATA_VERSION = 'SELECT data_version FROM user WHERE id = %s'
+GET_DATA_VERSIONS = 'SELECT id, data_version FROM user WHERE id IN ({})'
+BUMP_DATA_VERSION = 'UPDATE user SET data_version = data_version + 1 WHERE id = %s'
+# users are locked in id order, so refreshes of series with shared subscribers cannot deadlock
+BUMP_DATA_VERSIONS = 'UPDATE user SET data_version = data_version + 1 WHERE id IN ({}) ORDER BY id'
 
+# a series row matching everything pages show of it; refreshes that only move last_updated change nothing
+SERIES_SHOWN_UNCHANGED = '''
+    SELECT id FROM series
+    WHERE
+        id = %s
+        AND name <=> %s
+        AND air_time <=> %s
+        AND episode_length <=> %s
+        AND network <=> %s
+        AND banner <=> %s
+'''
 
-def _start_time(episode):
-    return datetime.datetime.combine(episode.air_date, episode.air_time)
+GET_UPDATE_CURSOR = 'SELECT last_poll FROM update_cursor WHERE id = 1'
+SET_UPDATE_CURSOR = '''
+    INSERT INTO update_cursor (id, last_poll) VALUES (1, %s)
+    ON DUPLICATE KEY UPDATE last_poll = VALUES(last_poll)
+'''
 
+SEASON_KEY = 'airedSeason'
+EPISODE_KEY = 'airedEpisodeNumber'
 
-def _end_time(episode):
-    return _start_time(episode) + datetime.timedelta(minutes=episode.episode_length)
+def _content_hash(title, air_date, overview):
+    content = json.dumps([title, air_date.isoformat(), overview])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
 
 
 def _sorting_key(title):
@@ -137,6 +392,26 @@ def _sorting_key(title):
     return title
 
 
+def _search_name(name):
+    return _sorting_key(' '.join(name.split()))[:50]
+
+
+def _search_terms(query):
+    # innodb ignores words shorter than its minimum token size, so they are left to the prefix match;
+    # stopwords are optional rather than required
+    words = re.findall(r'\w+', _search_name(query), re.UNICODE)
+    return ' '.join(
+        '{}{}*'.format('' if word in SEARCH_STOPWORDS else '+', word)
+        for word in words
+        if len(word) >= MIN_SEARCH_WORD
+    )
+
+
+def queue_position(series):
+    # most recently aired first, then by name; stable enough to page the queue by
+    return -series['episodes'][-1].start_time, _sorting_key(series['name']), series['id']
+
+
 def _series_key(series_tuple):
     return _sorting_key(series_tuple[1])
 
@@ -155,22 +430,64 @@ def decode_air_time(airtime):
 class ShowDatabase(object):
     _closed = True
 
-    def __init__(self, api=None):
+    def __init__(self, api=None, pool=None, cache=None):
         if api is None:
             api = tvdb.api.TvDbApi()
         self._api = api
-        with open(_CREDENTIALS_FILE) as cred_fobj:
-            credentials = json.load(cred_fobj)
-        self._connection = pymysql.connect(**credentials)
+        self._pool = pool
+        if pool is None:
+            self._connection = connect(load_credentials())
+        else:
+            self._connection = pool.acquire()
         self._closed = False
-        self._unseen_cache = {}
+        # without a shared cache, unseen episodes are only remembered for this instance
+        self._unseen_cache = UnseenCache() if cache is None else cache
+        self._data_versions = {}
 
     def clear_cache(self):
         self._unseen_cache.clear()
+        self._data_versions.clear()
+
+    def get_data_version(self, uid):
+        # read once per instance; also drops cached views another process made stale
+        if uid not in self._data_versions:
+            with self._connection.cursor() as cursor:
+                cursor.execute(GET_DATA_VERSION, (uid,))
+                row = cursor.fetchone()
+            self._data_versions[uid] = row[0] if row else None
+            self._unseen_cache.sync_version(uid, self._data_versions[uid])
+        return self._data_versions[uid]
+
+    def get_data_versions(self, uids):
+        # always read fresh, for watchers polling many users at once
+        uids = sorted(uids)
+        with self._connection.cursor() as cursor:
+            cursor.execute(GET_DATA_VERSIONS.format(', '.join('%s' for _ in uids)), tuple(uids))
+            versions = dict(cursor.fetchall())
+        for uid, version in versions.items():
+            self._unseen_cache.sync_version(uid, version)
+        return versions
+
+    def _bump_data_version(self, cursor, user_id):
+        cursor.execute(BUMP_DATA_VERSION, (user_id,))
+        cursor.execute(GET_DATA_VERSION, (user_id,))
+        row = cursor.fetchone()
+        self._data_versions[user_id] = row[0] if row else None
+        return self._data_versions[user_id]
+
+    @staticmethod
+    def _bump_data_versions(cursor, user_ids):
+        user_ids = sorted(user_ids)
+        for start in range(0, len(user_ids), UPSERT_BATCH_SIZE):
+            batch = user_ids[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(BUMP_DATA_VERSIONS.format(', '.join('%s' for _ in batch)), tuple(batch))
 
     def close(self):
         self._closed = True
-        self._connection.close()
+        if self._pool is None:
+            self._connection.close()
+        else:
+            self._pool.release(self._connection)
 
     def __del__(self):
         if not self._closed:
@@ -184,24 +501,37 @@ class ShowDatabase(object):
             else:
                 return -1
 
-    def _episode_ids(self, series_id):
+    def _stored_episodes(self, series_id):
         with self._connection.cursor() as cursor:
-            cursor.execute('SELECT id, season, episode FROM episode WHERE series_id = %s', (series_id,))
+            cursor.execute('SELECT id, season, episode, content_hash FROM episode WHERE series_id = %s', (series_id,))
             return {
-                (season, episode): episode_id
-                for episode_id, season, episode in cursor.fetchall()
+                (season, episode): (episode_id, content_hash)
+                for episode_id, season, episode, content_hash in cursor.fetchall()
             }
 
     @staticmethod
-    def _insert_update(cursor, table, keys, **fields):
-        query = 'INSERT INTO {} ({}) VALUES ({}) ON DUPLICATE KEY UPDATE {}'.format(
-            table,
-            ', '.join(fields.keys()),
-            ', '.join('%s' for _ in fields),
-            ', '.join(map('{}=%s'.format, [key for key in fields.keys() if key not in keys])),
+    def _insert_update(cursor, table, fields, keys, rows):
+        row_placeholder = '({})'.format(', '.join('%s' for _ in fields))
+        updates = ', '.join(
+            '{0}=VALUES({0})'.format(field)
+            for field in fields
+            if field not in keys
         )
-        non_keys = tuple(value for key, value in fields.items() if key not in keys)
-        cursor.execute(query, tuple(fields.values()) + non_keys)
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            query = 'INSERT INTO {} ({}) VALUES {} ON DUPLICATE KEY UPDATE {}'.format(
+                table,
+                ', '.join(fields),
+                ', '.join(row_placeholder for _ in batch),
+                updates,
+            )
+            cursor.execute(query, tuple(value for row in batch for value in row))
+
+    @staticmethod
+    def _delete_episodes(cursor, episode_ids):
+        for start in range(0, len(episode_ids), UPSERT_BATCH_SIZE):
+            batch = episode_ids[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(DELETE_EPISODES.format(', '.join('%s' for _ in batch)), tuple(batch))
 
     def update_series(self, series_id, force=False):
         series = self._api.series(series_id)
@@ -209,22 +539,31 @@ class ShowDatabase(object):
         if last_update == series['lastUpdated'] and not force:
             return
 
-        current_episodes = self._episode_ids(series_id)
-        tvdb_episodes = set()
+        current_episodes = self._stored_episodes(series_id)
+        tvdb_episodes = collections.OrderedDict()
+        shown = (
+            series['seriesName'],
+            decode_air_time(series['airsTime']),
+            int(series['runtime'] or '0'),
+            series['network'][:20] if series['network'] else None,
+            series['banner'],
+        )
         with self._connection.cursor() as cursor:
-            self._insert_update(
-                cursor=cursor,
-                table='series',
-                keys=('id',),
-                id=series_id,
-                name=series['seriesName'],
-                air_time=decode_air_time(series['airsTime']),
-                episode_length=int(series['runtime'] or '0'),
-                last_updated=int(series['lastUpdated']),
-                network=series['network'][:20] if series['network'] else None,
-                banner=series['banner'],
-            )
-            for episode in self._api.episodes(series_id):
+            series_changed = not cursor.execute(SERIES_SHOWN_UNCHANGED, (series_id,) + shown)
+            name, air_time, episode_length, network, banner = shown
+            self._insert_update(cursor, 'series', SERIES_FIELDS, SERIES_KEYS, [(
+                series_id,
+                name,
+                air_time,
+                episode_length,
+                int(series['lastUpdated']),
+                network,
+                banner,
+                _search_name(name),
+                0,
+                series['overview'],
+            )])
+            for episode in self._api.episodes(series_id, last_updated=series['lastUpdated']):
                 invalid = any((
                     episode[SEASON_KEY] is None,
                     episode[EPISODE_KEY] is None,
@@ -234,84 +573,330 @@ class ShowDatabase(object):
                     continue
                 season_number = int(episode[SEASON_KEY])
                 episode_number = int(episode[EPISODE_KEY])
-                key = (season_number, episode_number)
-                tvdb_episodes.add(key)
-                self._insert_update(
-                    cursor=cursor,
-                    table='episode',
-                    keys=('series_id', 'season', 'episode'),
-                    series_id=series_id,
-                    season=season_number,
-                    episode=episode_number,
-                    title=episode['episodeName'][:50] if episode['episodeName'] else None,
-                    air_date=datetime.datetime.strptime(episode['firstAired'], '%Y-%m-%d').date(),
-                    overview=episode['overview'],
+                title = episode['episodeName'][:50] if episode['episodeName'] else None
+                air_date = datetime.datetime.strptime(episode['firstAired'], '%Y-%m-%d').date()
+                # later duplicates win, same as when each episode was its own upsert
+                tvdb_episodes[(season_number, episode_number)] = (
+                    series_id,
+                    season_number,
+                    episode_number,
+                    title,
+                    air_date,
+                    episode['overview'],
+                    _content_hash(title, air_date, episode['overview']),
                 )
+
+            # only rows that are new or whose content hash differs are written
+            inserted = []
+            changed = []
+            for key, row in tvdb_episodes.items():
+                if key not in current_episodes:
+                    inserted.append(row)
+                elif current_episodes[key][1] != row[-1]:
+                    changed.append(row)
+            self._insert_update(cursor, 'episode', EPISODE_FIELDS, EPISODE_KEYS, inserted + changed)
             removed_episodes = [
-                episode
-                for key, episode in current_episodes.items()
+                episode_id
+                for key, (episode_id, _) in current_episodes.items()
                 if key not in tvdb_episodes
             ]
-            cursor.executemany(DELETE_EPISODE, removed_episodes)
+            self._delete_episodes(cursor, removed_episodes)
+            subscribers = []
+            if series_changed or inserted or changed or removed_episodes:
+                subscribers = self._subscribers(series_id)
+                self._bump_data_versions(cursor, subscribers)
 
         self._connection.commit()
-        return series['seriesName']
+        self._unseen_cache.invalidate(*subscribers)
+        return SeriesUpdate(
+            name=series['seriesName'],
+            inserted=len(inserted),
+            changed=len(changed),
+            unchanged=len(tvdb_episodes) - len(inserted) - len(changed),
+            deleted=len(removed_episodes),
+        )
 
-    def update_all_series(self, force=False):
-        if force:
-            with self._connection.cursor() as cursor:
-                cursor.execute('SELECT id FROM series')
-                series_ids = cursor.fetchall()
-        else:
-            with self._connection.cursor() as cursor:
-                cursor.execute('SELECT id, last_updated FROM series')
-                updates = dict(cursor.fetchall())
-            updated_series = self._api.updates()
-            series_ids = [
-                update['id']
-                for update in updated_series
-                if updates.get(update['id'], update['lastUpdated']) < update['lastUpdated']
-            ]
-        for series_id in series_ids:
+    def _all_series_ids(self):
+        with self._connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM series')
+            return [series_id for series_id, in cursor.fetchall()]
+
+    def _updated_series_ids(self, from_time, to_time):
+        with self._connection.cursor() as cursor:
+            cursor.execute('SELECT id, last_updated FROM series')
+            updates = dict(cursor.fetchall())
+        updated_series = self._api.updates(from_time, to_time)
+        return [
+            update['id']
+            for update in updated_series
+            if updates.get(update['id'], update['lastUpdated']) < update['lastUpdated']
+        ]
+
+    def _retry_series_ids(self):
+        with self._connection.cursor() as cursor:
+            cursor.execute(GET_RETRY_SERIES, (MAX_UPDATE_FAILURES,))
+            return [series_id for series_id, in cursor.fetchall()]
+
+    def series_state(self, series_id):
+        # (last_updated, update_failures), or None for a series never subscribed to
+        with self._connection.cursor() as cursor:
+            if not cursor.execute(GET_SERIES_STATE, (series_id,)):
+                return None
+            return cursor.fetchone()
+
+    def mark_update_failed(self, series_id):
+        with self._connection.cursor() as cursor:
+            cursor.execute(MARK_UPDATE_FAILED, (MAX_UPDATE_FAILURES, series_id))
+        self._connection.commit()
+
+    def _get_update_cursor(self):
+        with self._connection.cursor() as cursor:
+            if cursor.execute(GET_UPDATE_CURSOR):
+                return cursor.fetchone()[0]
+        return int(time.time() - tvdb.api.THREE_DAYS)
+
+    def _set_update_cursor(self, last_poll):
+        with self._connection.cursor() as cursor:
+            cursor.execute(SET_UPDATE_CURSOR, (last_poll,))
+        self._connection.commit()
+
+    def _subscribers(self, series_id):
+        with self._connection.cursor() as cursor:
+            cursor.execute('SELECT user_id FROM subscription WHERE series_id = %s', (series_id,))
+            return [user_id for user_id, in cursor.fetchall()]
+
+    def _update_and_report(self, series_id, force):
+        # False when the update failed and could not be flagged for the next run either
+        try:
+            result = self.update_series(series_id, force)
+        except Exception as e:
+            self._connection.rollback()
+            print('Cannot update series {}: {}'.format(series_id, e))
             try:
-                series_name = self.update_series(series_id, force)
+                self.mark_update_failed(series_id)
             except Exception as e:
-                print('Cannot update series {}: {}'.format(series_id, e))
+                self._connection.rollback()
+                print('Cannot mark series {} for retry: {}'.format(series_id, e))
+                return False
+        else:
+            if result is None:
+                print('Series [{}] is already up to date'.format(series_id))
             else:
-                print('Updated series {name} [{id}]'.format(id=series_id, name=series_name))
+                print(
+                    'Updated series {name} [{id}]: {inserted} inserted, {changed} changed, '
+                    '{unchanged} unchanged, {deleted} deleted'.format(id=series_id, **result._asdict())
+                )
+        return True
+
+    def _update_worker(self, pending, force, rate_limiter, lost):
+        try:
+            worker_db = ShowDatabase(
+                api=self._api.copy(rate_limiter=rate_limiter),
+                pool=self._pool,
+                cache=self._unseen_cache,
+            )
+        except Exception as e:
+            print('Cannot start update worker: {}'.format(e))
+            return
+        try:
+            while True:
+                try:
+                    series_id = pending.get_nowait()
+                except six.moves.queue.Empty:
+                    return
+                if not worker_db._update_and_report(series_id, force):
+                    lost.append(series_id)
+        finally:
+            worker_db.close()
+
+    def _update_series_ids(self, series_ids, force, workers, requests_per_second):
+        # Every worker gets its own connection and api client, but they all
+        # share one limiter so the total request rate to tvdb stays capped.
+        # Returns the series that failed without being flagged for retry,
+        # including any that no worker got to.
+        rate_limiter = tvdb.api.RateLimiter(requests_per_second)
+        pending = six.moves.queue.Queue()
+        for series_id in series_ids:
+            pending.put(series_id)
+        lost = []
+        if workers <= 1:
+            self._update_worker(pending, force, rate_limiter, lost)
+        else:
+            threads = [
+                threading.Thread(target=self._update_worker, args=(pending, force, rate_limiter, lost))
+                for _ in range(min(workers, len(series_ids)))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        while not pending.empty():
+            lost.append(pending.get_nowait())
+        return lost
+
+    def update_all_series(self, force=False, workers=1, requests_per_second=DEFAULT_REQUESTS_PER_SECOND):
+        if force:
+            self._update_series_ids(self._all_series_ids(), force, workers, requests_per_second)
+            return
+
+        # series that never loaded, like those whose background load failed, go first
+        self._update_series_ids(self._retry_series_ids(), force, workers, requests_per_second)
+
+        # poll from the last successful poll, one api-sized window at a time,
+        # so a gap between runs never drops changes. Failed series are flagged
+        # and retried above on the next run; if even that fails, the cursor
+        # stays before their window so the next run polls it again.
+        from_time = self._get_update_cursor()
+        to_time = int(time.time())
+        for window_start in range(from_time, to_time, tvdb.api.MAX_UPDATE_WINDOW):
+            window_end = min(window_start + tvdb.api.MAX_UPDATE_WINDOW, to_time)
+            series_ids = self._updated_series_ids(window_start, window_end)
+            lost = self._update_series_ids(series_ids, force, workers, requests_per_second)
+            if lost:
+                print('Stopping at the updates from {}; {} series will be polled again'.format(window_start, len(lost)))
+                return
+            self._set_update_cursor(window_end)
 
-    def subscribe(self, user_id, series_id):
-        self.update_series(series_id)
+    def subscribe(self, user_id, series_id, name=''):
+        # episodes are loaded separately by update_series
         with self._connection.cursor() as cursor:
+            cursor.execute(SERIES_PLACEHOLDER, (series_id, name[:50]))
             try:
                 cursor.execute(SUBSCRIPTION_INSERT, (user_id, series_id))
             except pymysql.err.IntegrityError:
                 return
+            cursor.execute(WATERMARK_INSERT, (user_id, series_id))
+            version = self._bump_data_version(cursor, user_id)
         self._connection.commit()
+        self._unseen_cache.invalidate(user_id)
+        self._unseen_cache.sync_version(user_id, version)
 
     def unsubscribe(self, user_id, series_id):
+        # the watermark and seen rows stay, in case the user subscribes again
         with self._connection.cursor() as cursor:
             cursor.execute('DELETE FROM subscription WHERE user_id = %s AND series_id = %s', (user_id, series_id))
+            version = self._bump_data_version(cursor, user_id)
         self._connection.commit()
+        self._unseen_cache.invalidate(user_id)
+        self._unseen_cache.sync_version(user_id, version)
+
+    @staticmethod
+    def _advance_watermark(cursor, user_id, series_id, season, episode):
+        if cursor.execute(SET_WATERMARK, (season, episode, user_id, series_id, season, episode)):
+            cursor.execute(DELETE_SEEN_UNTIL, (user_id, series_id, season, episode))
+
+    def _compact_watermark(self, cursor, user_id, series_id):
+        # move the watermark over any run of seen episodes directly after it
+        if not cursor.execute(GET_WATERMARK, (user_id, series_id)):
+            return
+        watermark = cursor.fetchone()
+        if cursor.execute(FIRST_UNSEEN_AFTER, (user_id, series_id) + watermark):
+            season, episode = cursor.fetchone()
+            new_watermark = (season, episode - 1)
+        elif cursor.execute(LAST_EPISODE, (series_id,)):
+            new_watermark = cursor.fetchone()
+        else:
+            return
+        if new_watermark > watermark:
+            self._advance_watermark(cursor, user_id, series_id, *new_watermark)
 
     def watch(self, user_id, episode_id):
         with self._connection.cursor() as cursor:
-            cursor.execute(WATCH, (user_id, episode_id))
+            cursor.execute(WATCH, (user_id, user_id, episode_id))
+            cursor.execute(GET_EPISODE_DATA, (episode_id,))
+            series_id, _, _ = cursor.fetchone()
+            self._compact_watermark(cursor, user_id, series_id)
+            version = self._bump_data_version(cursor, user_id)
         self._connection.commit()
+        self._unseen_cache.discard(
+            user_id,
+            lambda unseen_id, unseen_series_id, unseen_season, unseen_episode: unseen_id == episode_id,
+            version,
+        )
 
     def update_subscription(self, subscription_id, shift_len, shift_type, enabled):
         with self._connection.cursor() as cursor:
             cursor.execute(UPDATE_SUBSCRIPTION, (shift_len, shift_type, enabled, subscription_id))
+            cursor.execute('SELECT user_id FROM subscription WHERE id = %s', (subscription_id,))
+            user_ids = [user_id for user_id, in cursor.fetchall()]
+            versions = {user_id: self._bump_data_version(cursor, user_id) for user_id in user_ids}
         self._connection.commit()
+        for user_id, version in versions.items():
+            self._unseen_cache.invalidate(user_id)
+            self._unseen_cache.sync_version(user_id, version)
 
     def watch_until(self, user_id, episode_id):
         with self._connection.cursor() as cursor:
             cursor.execute(GET_EPISODE_DATA, (episode_id,))
             series_id, season, episode = cursor.fetchone()
-            cursor.execute(EPISODES_UNTIL, (series_id, season, season, episode))
-            episode_ids = cursor.fetchall()
-            cursor.executemany(WATCH, ((user_id, episode_id) for episode_id in episode_ids))
+            self._advance_watermark(cursor, user_id, series_id, season, episode)
+            self._compact_watermark(cursor, user_id, series_id)
+            version = self._bump_data_version(cursor, user_id)
+        self._connection.commit()
+        self._unseen_cache.discard(
+            user_id,
+            lambda unseen_id, unseen_series_id, unseen_season, unseen_episode: (
+                unseen_series_id == series_id and (unseen_season, unseen_episode) <= (season, episode)
+            ),
+            version,
+        )
+
+    def _episodes_data(self, cursor, episode_ids):
+        episodes = {}
+        for start in range(0, len(episode_ids), UPSERT_BATCH_SIZE):
+            batch = episode_ids[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(GET_EPISODES_DATA.format(', '.join('%s' for _ in batch)), tuple(batch))
+            episodes.update((row[0], row[1:]) for row in cursor.fetchall())
+        return episodes
+
+    def watch_many(self, user_id, actions):
+        # Applies (action, episode_id) pairs in one transaction and returns the
+        # episode ids that exist; unknown episodes are skipped.
+        with self._connection.cursor() as cursor:
+            episodes = self._episodes_data(cursor, sorted(set(episode_id for _, episode_id in actions)))
+            watched = set()
+            until = {}
+            for action, episode_id in actions:
+                if episode_id not in episodes:
+                    continue
+                series_id, season, episode = episodes[episode_id]
+                if action == WATCH_UNTIL_ACTION:
+                    until[series_id] = max(until.get(series_id, (-1, -1)), (season, episode))
+                else:
+                    watched.add(episode_id)
+            if not watched and not until:
+                return []
+
+            watched_rows = sorted(watched)
+            for start in range(0, len(watched_rows), UPSERT_BATCH_SIZE):
+                batch = watched_rows[start:start + UPSERT_BATCH_SIZE]
+                cursor.execute(WATCH_MANY.format(', '.join('%s' for _ in batch)), (user_id, user_id) + tuple(batch))
+            if until:
+                targets = sorted(until.items())
+                cursor.execute(
+                    SET_WATERMARKS.format(' UNION ALL '.join(WATERMARK_TARGET for _ in targets)),
+                    tuple(value for series_id, (season, episode) in targets for value in (series_id, season, episode)) +
+                    (user_id,),
+                )
+            series_ids = sorted(set(episodes[episode_id][0] for episode_id in watched) | set(until))
+            for series_id in series_ids:
+                self._compact_watermark(cursor, user_id, series_id)
+            if until:
+                cursor.execute(
+                    DELETE_SEEN_UNDER_WATERMARKS.format(', '.join('%s' for _ in until)),
+                    (user_id,) + tuple(sorted(until)),
+                )
+            version = self._bump_data_version(cursor, user_id)
         self._connection.commit()
+        self._unseen_cache.discard(
+            user_id,
+            lambda unseen_id, unseen_series_id, unseen_season, unseen_episode: (
+                unseen_id in watched or
+                (unseen_series_id in until and (unseen_season, unseen_episode) <= until[unseen_series_id])
+            ),
+            version,
+        )
+        return sorted(set(episode_id for _, episode_id in actions if episode_id in episodes))
 
     def user_names(self):
         with self._connection.cursor() as cursor:
@@ -320,7 +905,8 @@ class ShowDatabase(object):
 
     def get_user_id(self, username):
         with self._connection.cursor() as cursor:
-            cursor.execute('SELECT id FROM user WHERE name = %s', username)
+            if not cursor.execute('SELECT id FROM user WHERE name = %s', username):
+                return None
             return cursor.fetchone()[0]
 
     def get_user_name(self, uid):
@@ -340,79 +926,185 @@ class ShowDatabase(object):
             cursor.execute(GET_SUBSCRIPTION_DATA, (uid,))
             return [Subscription(*row) for row in sorted(cursor.fetchall(), key=_series_key)]
 
-    def get_unseen_episodes(self, uid):
-        if uid is None:
+    def import_subscriptions(self, uid, subscriptions):
+        # subscriptions are (series_id, name, shift_len, shift_type, enabled); series
+        # not in the database yet are added as placeholders for update_series to fill in
+        if not subscriptions:
+            return
+        with self._connection.cursor() as cursor:
+            cursor.executemany(SERIES_PLACEHOLDER, [
+                (series_id, (name or '')[:50]) for series_id, name, _, _, _ in subscriptions
+            ])
+            cursor.executemany(IMPORT_SUBSCRIPTION, [
+                (uid, series_id, shift_len, shift_type, enabled)
+                for series_id, _, shift_len, shift_type, enabled in subscriptions
+            ])
+            cursor.executemany(WATERMARK_INSERT, [(uid, series_id) for series_id, _, _, _, _ in subscriptions])
+            version = self._bump_data_version(cursor, uid)
+        self._connection.commit()
+        self._unseen_cache.invalidate(uid)
+        self._unseen_cache.sync_version(uid, version)
+
+    def placeholder_series_ids(self, series_ids):
+        series_ids = sorted(set(series_ids))
+        if not series_ids:
             return []
-        if uid not in self._unseen_cache:
+        with self._connection.cursor() as cursor:
+            cursor.execute(GET_PLACEHOLDER_SERIES.format(', '.join('%s' for _ in series_ids)), tuple(series_ids))
+            return [series_id for series_id, in cursor.fetchall()]
+
+    def export_seen(self, uid):
+        # streamed from the server, so no other query may run on this connection until it is exhausted
+        with self._connection.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(EXPORT_SEEN, (uid, uid))
+            for row in cursor:
+                yield row
+
+    def import_seen(self, uid, seen):
+        # seen is (series_id, season, episode, watch_time); returns how many episodes were found.
+        # Episodes the watermark already covers count as found but get no seen row.
+        # Watermarks are left alone until compact_watermarks.
+        found = {}
+        with self._connection.cursor() as cursor:
+            for start in range(0, len(seen), UPSERT_BATCH_SIZE):
+                keys = [row[:3] for row in seen[start:start + UPSERT_BATCH_SIZE]]
+                cursor.execute(
+                    RESOLVE_EPISODES.format(', '.join('(%s, %s, %s)' for _ in keys)),
+                    (uid,) + tuple(value for key in keys for value in key),
+                )
+                found.update((row[:3], row[3:]) for row in cursor.fetchall())
+            num_found = sum(1 for row in seen if row[:3] in found)
+            rows = [(uid, found[row[:3]][0], row[3]) for row in seen if row[:3] in found and not found[row[:3]][1]]
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    IMPORT_SEEN.format(', '.join('(%s, %s, %s)' for _ in batch)),
+                    tuple(value for row in batch for value in row),
+                )
+        self._connection.commit()
+        return num_found
+
+    def compact_watermarks(self, uid, series_ids):
+        with self._connection.cursor() as cursor:
+            for series_id in sorted(set(series_ids)):
+                self._compact_watermark(cursor, uid, series_id)
+            version = self._bump_data_version(cursor, uid)
+        self._connection.commit()
+        self._unseen_cache.invalidate(uid)
+        self._unseen_cache.sync_version(uid, version)
+
+    def search_series(self, query, limit):
+        # results look like tvdb search results so they can be merged with them
+        prefix = _search_name(query).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        terms = _search_terms(query)
+        with self._connection.cursor() as cursor:
+            cursor.execute(SEARCH_SERIES, (prefix, terms, prefix, terms, limit))
+            return [
+                {'id': series_id, 'seriesName': name, 'network': network, 'banner': banner, 'overview': overview}
+                for series_id, name, network, banner, overview in cursor.fetchall()
+            ]
+
+    def _summary(self, uid, now):
+        self.get_data_version(uid)
+        summary = self._unseen_cache.get(uid, 'summary', now)
+        if summary is None:
+            generation = self._unseen_cache.generation(uid)
             with self._connection.cursor() as cursor:
-                cursor.execute(GET_UNSEEN, uid)
-                self._unseen_cache[uid] = [make_unseen(row) for row in cursor.fetchall()]
-        return self._unseen_cache[uid]
+                cursor.execute(GET_UNSEEN_SUMMARY, (now,) * 6 + (uid,))
+                num_queued, num_recording, next_start, next_end = cursor.fetchone()
+            changes = [change for change in (next_start, next_end) if change is not None]
+            summary = UnseenSummary(
+                num_queued=int(num_queued),
+                num_recording=int(num_recording),
+                next_change=min(changes) if changes else datetime.datetime.max,
+            )
+            self._unseen_cache.put(uid, 'summary', summary, generation, expires=summary.next_change, since=now)
+        return summary
 
-    def get_queued_by_series(self, uid):
+    def _unseen_view(self, uid, key, query, params, now, expires=datetime.datetime.max):
+        # Each view loads only the episodes it shows, so a cold cache never
+        # pulls in far past or far future episodes. Views stay valid from now
+        # until an episode starts or ends, or the caller's own expiry.
+        self.get_data_version(uid)
+        unseen = self._unseen_cache.get(uid, key, now)
+        if unseen is None:
+            generation = self._unseen_cache.generation(uid)
+            with self._connection.cursor() as cursor:
+                cursor.execute(query, (uid,) + params)
+                unseen = UnseenEpisodes(cursor.fetchall())
+            expires = min(expires, self._summary(uid, now).next_change)
+            self._unseen_cache.put(uid, key, unseen, generation, expires=expires, since=now)
+        return unseen
+
+    def get_queued_by_series(self, uid, now=None):
         if uid is None:
             return []
-        now = datetime.datetime.now()
-        series = collections.defaultdict(list)
-        for unseen in self.get_unseen_episodes(uid):
-            if _start_time(unseen) > now:
-                continue
-            series[(_sorting_key(unseen.series_name), unseen.series_id)].append(unseen)
-        queued = [
-            {
-                'name': group[0].series_name,
-                'id': group[0].series_id,
-                'banner': group[0].series_banner,
-                'num_episodes': len(group),
-                'episodes': list(sorted(group, key=lambda episode: (episode.season, episode.episode))),
-            }
-            for _, group in sorted(series.items())
-        ]
-        queued.sort(key=lambda group: _start_time(group['episodes'][-1]), reverse=True)
+        now = datetime.datetime.now() if now is None else now
+        unseen = self._unseen_view(uid, 'queued', GET_QUEUED, (now,), now)
+        with metrics.timed('python', 'get_queued_by_series'):
+            queued = []
+            for series_id, indices in unseen.by_series(unseen.queued(to_timestamp(now))).items():
+                indices.sort(key=lambda index: (unseen.seasons[index], unseen.episodes[index]))
+                name, banner = unseen.series[series_id]
+                queued.append({
+                    'name': name,
+                    'id': series_id,
+                    'banner': banner,
+                    'num_episodes': len(indices),
+                    'episodes': [unseen.unseen(index) for index in indices],
+                })
+            queued.sort(key=queue_position)
         return queued
 
-    def get_preview(self, uid, days):
-        now = datetime.datetime.now()
-        episodes = [
-            episode for episode in self.get_unseen_episodes(uid)
-            if _end_time(episode) > now
-        ]
-        episodes_now = [episode for episode in episodes if _start_time(episode) <= now]
-        episodes_now.sort(key=_start_time)
-        episodes_later = (episode for episode in episodes if _start_time(episode) > now)
-
-        preview_list = [[] for _ in range(days)]
-        for episode in sorted(episodes_later, key=_start_time):
-            num_days = (_start_time(episode).date() - now.date()).days
-            if num_days >= days:
-                break
-            preview_list[num_days].append(episode)
-
-        tomorrow = now.date() + datetime.timedelta(days=1)
-
-        def day_name(episode):
-            start_date = _start_time(episode).date()
-            if start_date == now.date():
-                return 'Today'
-            elif start_date == tomorrow:
-                return 'Tomorrow'
-            else:
-                return _start_time(episode).strftime('%A')
+    def get_overview(self, episode_id):
+        with self._connection.cursor() as cursor:
+            if not cursor.execute(GET_OVERVIEW, (episode_id,)):
+                return None
+            return cursor.fetchone()[0]
 
-        preview_days = [
-            {
-                'day': day_name(day[0]),
-                'episodes': day,
-            }
-            for day in preview_list if day
+    def get_preview(self, uid, days, now=None):
+        if uid is None:
+            return {'recording': [], 'preview': []}
+        now = datetime.datetime.now() if now is None else now
+        today = datetime.datetime.combine(now.date(), datetime.time())
+        unseen = self._unseen_view(
+            uid,
+            ('scheduled', days),
+            GET_SCHEDULED,
+            (now, today + datetime.timedelta(days=days)),
+            now,
+            expires=today + datetime.timedelta(days=1),
+        )
+        midnight = to_timestamp(today)
+        day_names = ['Today', 'Tomorrow'] + [
+            (today + datetime.timedelta(days=day)).strftime('%A') for day in range(2, days)
         ]
-        return {'recording': episodes_now, 'preview': preview_days}
 
-    def num_queued(self, uid):
+        with metrics.timed('python', 'get_preview'):
+            preview_list = [[] for _ in range(days)]
+            for index in unseen.upcoming(to_timestamp(now), midnight + days * 86400):
+                preview_list[(unseen.starts[index] - midnight) // 86400].append(unseen.scheduled(index))
+            preview_days = [
+                {
+                    'day': day_names[day],
+                    'episodes': episodes,
+                }
+                for day, episodes in enumerate(preview_list) if episodes
+            ]
+            recording = [unseen.scheduled(index) for index in unseen.recording(to_timestamp(now))]
+        return {'recording': recording, 'preview': preview_days}
+
+    def get_next_change(self, uid, now=None):
+        return self._summary(uid, datetime.datetime.now() if now is None else now).next_change
+
+    def get_counts(self, uid, now=None):
         if uid is None:
-            return -1
-        return sum(series['num_episodes'] for series in self.get_queued_by_series(uid))
+            return -1, 0
+        summary = self._summary(uid, datetime.datetime.now() if now is None else now)
+        return summary.num_queued, summary.num_recording
+
+    def num_queued(self, uid):
+        return self.get_counts(uid)[0]
 
     def num_recording(self, uid):
-        now = datetime.datetime.now()
-        return sum(_start_time(episode) <= now <= _end_time(episode) for episode in self.get_unseen_episodes(uid))
+        return self.get_counts(uid)[1]
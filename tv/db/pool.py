@@ -0,0 +1,144 @@
+import collections
+import json
+import threading
+import time
+
+import pymysql
+import pymysql.cursors
+
+from tv import metrics
+
+
+CREDENTIALS_FILE = '/etc/tvq/credentials'
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RECYCLE_SECONDS = 3600
+DEFAULT_PING_AFTER_SECONDS = 30
+DEFAULT_ACQUIRE_TIMEOUT = 30
+
+_credentials = {}
+_credentials_lock = threading.Lock()
+
+
+def load_credentials(path=CREDENTIALS_FILE):
+    with _credentials_lock:
+        if path not in _credentials:
+            with open(path) as cred_fobj:
+                _credentials[path] = json.load(cred_fobj)
+        return _credentials[path]
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class TimedCursor(pymysql.cursors.Cursor):
+    # executemany goes through execute too, once per batch or per row
+    def execute(self, query, args=None):
+        with metrics.timed('sql', metrics.sql_name(query)):
+            return super(TimedCursor, self).execute(query, args)
+
+
+def connect(credentials):
+    options = dict(credentials)
+    options.setdefault('cursorclass', TimedCursor)
+    return pymysql.connect(**options)
+
+
+class ConnectionPool(object):
+    def __init__(
+        self,
+        max_size=DEFAULT_POOL_SIZE,
+        recycle_seconds=DEFAULT_RECYCLE_SECONDS,
+        ping_after_seconds=DEFAULT_PING_AFTER_SECONDS,
+        acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT,
+        credentials=None,
+    ):
+        self._credentials = credentials if credentials is not None else load_credentials()
+        self._recycle_seconds = recycle_seconds
+        self._ping_after_seconds = ping_after_seconds
+        self._acquire_timeout = acquire_timeout
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        # counts connections handed out; a Condition rather than a semaphore because
+        # python 2 semaphores cannot time out
+        self._in_use = 0
+        self._slot_freed = threading.Condition(self._lock)
+        # idle connections as (connection, created, last_used), most recently used last
+        self._idle = collections.deque()
+        self._created = {}
+
+    def _connect(self):
+        connection = connect(self._credentials)
+        with self._lock:
+            self._created[connection] = time.time()
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self._created.pop(connection, None)
+        try:
+            connection.close()
+        except pymysql.err.Error:
+            pass
+
+    def _healthy(self, connection, created, last_used):
+        now = time.time()
+        if now - created > self._recycle_seconds:
+            return False
+        if now - last_used > self._ping_after_seconds:
+            try:
+                connection.ping(reconnect=False)
+            except pymysql.err.Error:
+                return False
+        return True
+
+    def _take_slot(self):
+        deadline = time.time() + self._acquire_timeout
+        with self._slot_freed:
+            while self._in_use >= self._max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout('no database connection available after {}s'.format(self._acquire_timeout))
+                self._slot_freed.wait(remaining)
+            self._in_use += 1
+
+    def _release_slot(self):
+        with self._slot_freed:
+            self._in_use -= 1
+            self._slot_freed.notify()
+
+    def acquire(self):
+        self._take_slot()
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._connect()
+                if self._healthy(*entry):
+                    return entry[0]
+                self._discard(entry[0])
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def release(self, connection):
+        try:
+            if connection.open:
+                connection.rollback()
+                with self._lock:
+                    self._idle.append((connection, self._created[connection], time.time()))
+            else:
+                self._discard(connection)
+        except pymysql.err.Error:
+            self._discard(connection)
+        finally:
+            self._release_slot()
+
+    def close(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _, _ in idle:
+            self._discard(connection)
@@ -0,0 +1,104 @@
+import datetime
+import unittest
+
+from tv.db.cache import UnseenCache
+from tv.db.unseen import UnseenEpisodes
+
+
+NOW = datetime.datetime(2020, 1, 1, 20)
+
+
+def _episodes(*episode_ids):
+    return UnseenEpisodes(
+        (episode_id, 'title', 1, 'Series', None, 1, episode_id, episode_id * 3600, episode_id * 3600 + 1800)
+        for episode_id in episode_ids
+    )
+
+
+class UnseenCacheTest(unittest.TestCase):
+    def test_get_returns_what_was_put(self):
+        cache = UnseenCache()
+        episodes = _episodes(1, 2)
+        cache.put(1, 'unseen', episodes, cache.generation(1))
+        self.assertIs(cache.get(1, 'unseen', NOW), episodes)
+        self.assertIsNone(cache.get(1, 'other', NOW))
+        self.assertIsNone(cache.get(2, 'unseen', NOW))
+
+    def test_put_after_a_write_is_ignored(self):
+        cache = UnseenCache()
+        generation = cache.generation(1)
+        cache.invalidate(1)
+        cache.put(1, 'unseen', _episodes(1), generation)
+        self.assertIsNone(cache.get(1, 'unseen', NOW))
+
+    def test_expired_entries_are_dropped(self):
+        cache = UnseenCache()
+        cache.put(1, 'summary', 'value', cache.generation(1), expires=NOW)
+        self.assertEqual(cache.get(1, 'summary', NOW - datetime.timedelta(seconds=1)), 'value')
+        self.assertIsNone(cache.get(1, 'summary', NOW))
+
+    def test_entries_are_not_used_before_they_were_loaded_for(self):
+        cache = UnseenCache()
+        cache.put(1, 'queued', _episodes(1), cache.generation(1), since=NOW)
+        self.assertIsNone(cache.get(1, 'queued', NOW - datetime.timedelta(seconds=1)))
+        self.assertIsNotNone(cache.get(1, 'queued', NOW))
+
+    def test_least_recently_used_user_is_evicted(self):
+        cache = UnseenCache(max_users=2)
+        for uid in (1, 2):
+            cache.put(uid, 'unseen', _episodes(uid), cache.generation(uid))
+        cache.get(1, 'unseen', NOW)
+        cache.put(3, 'unseen', _episodes(3), cache.generation(3))
+        self.assertIsNotNone(cache.get(1, 'unseen', NOW))
+        self.assertIsNone(cache.get(2, 'unseen', NOW))
+        self.assertIsNotNone(cache.get(3, 'unseen', NOW))
+
+    def test_users_are_evicted_to_stay_under_max_rows(self):
+        cache = UnseenCache(max_rows=3)
+        cache.put(1, 'unseen', _episodes(1, 2), cache.generation(1))
+        cache.put(2, 'unseen', _episodes(3, 4), cache.generation(2))
+        self.assertIsNone(cache.get(1, 'unseen', NOW))
+        self.assertIsNotNone(cache.get(2, 'unseen', NOW))
+        cache.put(3, 'unseen', _episodes(5, 6, 7, 8), cache.generation(3))
+        self.assertIsNone(cache.get(3, 'unseen', NOW))
+
+    def test_sync_version_drops_entries_on_unexpected_version(self):
+        cache = UnseenCache()
+        cache.sync_version(1, 5)
+        cache.put(1, 'unseen', _episodes(1), cache.generation(1))
+        cache.sync_version(1, 5)
+        self.assertIsNotNone(cache.get(1, 'unseen', NOW))
+        cache.sync_version(1, 6)
+        self.assertIsNone(cache.get(1, 'unseen', NOW))
+
+    def test_discard_patches_after_the_next_version(self):
+        cache = UnseenCache()
+        cache.sync_version(1, 5)
+        cache.put(1, 'unseen', _episodes(1, 2, 3), cache.generation(1))
+        cache.put(1, 'summary', 'value', cache.generation(1))
+        cache.discard(1, lambda episode_id, series_id, season, episode: episode_id == 2, version=6)
+        self.assertEqual(list(cache.get(1, 'unseen', NOW).episode_ids), [1, 3])
+        self.assertIsNone(cache.get(1, 'summary', NOW))
+        # the patch is a write, so loads that started before it are not stored
+        cache.sync_version(1, 6)
+        self.assertIsNotNone(cache.get(1, 'unseen', NOW))
+
+    def test_discard_drops_entries_after_a_missed_version(self):
+        cache = UnseenCache()
+        cache.sync_version(1, 5)
+        cache.put(1, 'unseen', _episodes(1, 2), cache.generation(1))
+        cache.discard(1, lambda episode_id, series_id, season, episode: episode_id == 2, version=7)
+        self.assertIsNone(cache.get(1, 'unseen', NOW))
+
+    def test_clear_drops_everything(self):
+        cache = UnseenCache()
+        generation = cache.generation(1)
+        cache.put(1, 'unseen', _episodes(1), generation)
+        cache.clear()
+        self.assertIsNone(cache.get(1, 'unseen', NOW))
+        cache.put(1, 'unseen', _episodes(1), generation)
+        self.assertIsNone(cache.get(1, 'unseen', NOW))
+
+
+if __name__ == '__main__':
+    unittest.main()
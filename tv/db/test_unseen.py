@@ -0,0 +1,72 @@
+import datetime
+import unittest
+
+from tv.db.unseen import Scheduled, Unseen, UnseenEpisodes, to_datetime, to_timestamp
+
+
+HOUR = 3600
+
+
+def _row(episode_id, series_id, start, length=HOUR):
+    return (episode_id, 'Episode {}'.format(episode_id), series_id, 'Series {}'.format(series_id), None, 1, episode_id,
+            start, start + length)
+
+
+class UnseenEpisodesTest(unittest.TestCase):
+    def setUp(self):
+        # episodes 1 and 2 have aired, 3 is airing at 10 * HOUR, 4 and 5 are still to come
+        self.unseen = UnseenEpisodes([
+            _row(1, 1, 0),
+            _row(2, 2, 5 * HOUR),
+            _row(3, 1, 9 * HOUR, length=2 * HOUR),
+            _row(4, 2, 12 * HOUR),
+            _row(5, 1, 30 * HOUR),
+        ])
+
+    def _ids(self, indices):
+        return [self.unseen.episode_ids[index] for index in indices]
+
+    def test_queued_includes_episodes_starting_at_now(self):
+        self.assertEqual(self._ids(self.unseen.queued(9 * HOUR - 1)), [1, 2])
+        self.assertEqual(self._ids(self.unseen.queued(9 * HOUR)), [1, 2, 3])
+
+    def test_recording_only_includes_episodes_still_airing(self):
+        self.assertEqual(self._ids(self.unseen.recording(10 * HOUR)), [3])
+        self.assertEqual(self._ids(self.unseen.recording(11 * HOUR)), [])
+        self.assertEqual(self._ids(self.unseen.recording(5 * HOUR)), [2])
+
+    def test_upcoming_is_after_now_and_before_until(self):
+        self.assertEqual(self._ids(self.unseen.upcoming(10 * HOUR, 30 * HOUR)), [4])
+        self.assertEqual(self._ids(self.unseen.upcoming(10 * HOUR, 30 * HOUR + 1)), [4, 5])
+        self.assertEqual(self._ids(self.unseen.upcoming(12 * HOUR, 40 * HOUR)), [5])
+
+    def test_by_series_keeps_start_order(self):
+        groups = self.unseen.by_series(self.unseen.queued(40 * HOUR))
+        self.assertEqual(list(groups), [1, 2])
+        self.assertEqual(self._ids(groups[1]), [1, 3, 5])
+
+    def test_rows_are_built_on_demand(self):
+        self.assertEqual(
+            self.unseen.unseen(1),
+            Unseen(2, 'Episode 2', None, 'Series 2', 2, 1, 2, 5 * HOUR),
+        )
+        self.assertEqual(
+            self.unseen.scheduled(2),
+            Scheduled(3, 'Episode 3', 'Series 1', 1, 1, 3, to_datetime(9 * HOUR), to_datetime(11 * HOUR)),
+        )
+
+    def test_without_drops_matching_episodes(self):
+        kept = self.unseen.without(lambda episode_id, series_id, season, episode: series_id == 1)
+        self.assertEqual(list(kept.episode_ids), [2, 4])
+        self.assertEqual(set(kept.series), {2})
+        self.assertEqual(len(self.unseen), 5)
+        # recording still looks back over the longest runtime that is left
+        self.assertEqual(list(kept.recording(12 * HOUR + 1)), [1])
+
+    def test_timestamps_round_trip(self):
+        moment = datetime.datetime(2020, 1, 1, 20, 30)
+        self.assertEqual(to_datetime(to_timestamp(moment)), moment)
+
+
+if __name__ == '__main__':
+    unittest.main()
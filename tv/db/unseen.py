@@ -0,0 +1,152 @@
+import array
+import bisect
+import collections
+import datetime
+
+
+# start and end times are seconds from this moment in the server's local time,
+# matching the naive datetimes mysql stores
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# python 2 arrays have no 'q'; 'l' is 64 bits on the linux servers this runs on
+INT64 = 'q' if 'q' in getattr(array, 'typecodes', '') else 'l'
+
+# start_time is a timestamp; see to_datetime
+Unseen = collections.namedtuple('Unseen', (
+    'episode_id',
+    'episode_title',
+    'series_banner',
+    'series_name',
+    'series_id',
+    'season',
+    'episode',
+    'start_time',
+))
+
+Scheduled = collections.namedtuple('Scheduled', (
+    'episode_id',
+    'episode_title',
+    'series_name',
+    'series_id',
+    'season',
+    'episode',
+    'start_time',
+    'end_time',
+))
+
+
+def to_timestamp(moment):
+    delta = moment - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+def to_datetime(timestamp):
+    return EPOCH + datetime.timedelta(seconds=timestamp)
+
+
+class UnseenEpisodes(object):
+    # One column per field, ordered by start time, so time windows are
+    # bisected instead of scanned. Series names and banners are stored once
+    # per series rather than once per episode.
+    __slots__ = (
+        'episode_ids',
+        'titles',
+        'series_ids',
+        'seasons',
+        'episodes',
+        'starts',
+        'ends',
+        'series',
+        '_max_length',
+    )
+
+    def __init__(self, rows=()):
+        # rows are (episode_id, title, series_id, name, banner, season, episode, start, end), sorted by start
+        self.episode_ids = array.array(INT64)
+        self.titles = []
+        self.series_ids = array.array(INT64)
+        self.seasons = array.array('i')
+        self.episodes = array.array('i')
+        self.starts = array.array(INT64)
+        self.ends = array.array(INT64)
+        self.series = {}
+        self._max_length = 0
+        for episode_id, title, series_id, name, banner, season, episode, start, end in rows:
+            self._append(episode_id, title, series_id, season, episode, start, end)
+            if series_id not in self.series:
+                self.series[series_id] = (name, banner)
+
+    def _append(self, episode_id, title, series_id, season, episode, start, end):
+        self.episode_ids.append(episode_id)
+        self.titles.append(title)
+        self.series_ids.append(series_id)
+        self.seasons.append(season)
+        self.episodes.append(episode)
+        self.starts.append(start)
+        self.ends.append(end)
+        self._max_length = max(self._max_length, end - start)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def queued(self, now):
+        return range(bisect.bisect_right(self.starts, now))
+
+    def recording(self, now):
+        # only episodes that started within the longest runtime can still be airing
+        first = bisect.bisect_left(self.starts, now - self._max_length)
+        return [index for index in range(first, bisect.bisect_right(self.starts, now)) if self.ends[index] > now]
+
+    def upcoming(self, now, until):
+        return range(bisect.bisect_right(self.starts, now), bisect.bisect_left(self.starts, until))
+
+    def by_series(self, indices):
+        groups = collections.OrderedDict()
+        for index in indices:
+            groups.setdefault(self.series_ids[index], []).append(index)
+        return groups
+
+    def unseen(self, index):
+        name, banner = self.series[self.series_ids[index]]
+        return Unseen(
+            self.episode_ids[index],
+            self.titles[index],
+            banner,
+            name,
+            self.series_ids[index],
+            self.seasons[index],
+            self.episodes[index],
+            self.starts[index],
+        )
+
+    def scheduled(self, index):
+        return Scheduled(
+            self.episode_ids[index],
+            self.titles[index],
+            self.series[self.series_ids[index]][0],
+            self.series_ids[index],
+            self.seasons[index],
+            self.episodes[index],
+            to_datetime(self.starts[index]),
+            to_datetime(self.ends[index]),
+        )
+
+    def without(self, predicate):
+        # a copy without the episodes matching predicate(episode_id, series_id, season, episode)
+        kept = UnseenEpisodes()
+        for index in range(len(self)):
+            series_id = self.series_ids[index]
+            if predicate(self.episode_ids[index], series_id, self.seasons[index], self.episodes[index]):
+                continue
+            kept._append(
+                self.episode_ids[index],
+                self.titles[index],
+                series_id,
+                self.seasons[index],
+                self.episodes[index],
+                self.starts[index],
+                self.ends[index],
+            )
+            if series_id not in kept.series:
+                kept.series[series_id] = self.series[series_id]
+        return kept
@@ -0,0 +1,163 @@
+import collections
+import csv
+import datetime
+import json
+
+
+JSON_LINES = 'jsonl'
+CSV = 'csv'
+FORMATS = (JSON_LINES, CSV)
+
+SUBSCRIPTION = 'subscription'
+SEEN = 'seen'
+
+CSV_FIELDS = (
+    'record',
+    'series_id',
+    'series_name',
+    'season',
+    'episode',
+    'watch_time',
+    'shift_len',
+    'shift_type',
+    'enabled',
+)
+
+SHIFT_TYPES = ('HOURS', 'DAYS')
+
+WATCH_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# seen records resolved and inserted per round trip batch
+IMPORT_BATCH_SIZE = 5000
+
+HistoryCounts = collections.namedtuple('HistoryCounts', (
+    'subscriptions',
+    'seen',
+    'unresolved',
+))
+
+
+def _json_writer(output):
+    def write(record):
+        output.write(json.dumps(record, sort_keys=True))
+        output.write('\n')
+    return write
+
+
+def _csv_writer(output):
+    writer = csv.DictWriter(output, CSV_FIELDS)
+    writer.writeheader()
+
+    def write(record):
+        writer.writerow(dict(record, enabled=int(record['enabled'])) if 'enabled' in record else record)
+    return write
+
+
+def _json_reader(source):
+    for line in source:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _csv_reader(source):
+    # csv has no types, so empty cells are missing values and numbers are parsed on use
+    for row in csv.DictReader(source):
+        yield {key: value for key, value in row.items() if value not in ('', None)}
+
+
+def export_history(show_db, uid, output, fmt=JSON_LINES):
+    # subscriptions first, so an import has every series before its episodes
+    write = _json_writer(output) if fmt == JSON_LINES else _csv_writer(output)
+    subscriptions = 0
+    for subscription in show_db.get_subscription_data(uid):
+        write({
+            'record': SUBSCRIPTION,
+            'series_id': subscription.series_id,
+            'series_name': subscription.name,
+            'shift_len': subscription.shift_len,
+            'shift_type': subscription.shift_type,
+            'enabled': bool(subscription.enabled),
+        })
+        subscriptions += 1
+    seen = 0
+    for series_id, season, episode, watch_time in show_db.export_seen(uid):
+        write({
+            'record': SEEN,
+            'series_id': series_id,
+            'season': season,
+            'episode': episode,
+            'watch_time': watch_time.strftime(WATCH_TIME_FORMAT) if watch_time is not None else None,
+        })
+        seen += 1
+    return HistoryCounts(subscriptions=subscriptions, seen=seen, unresolved=0)
+
+
+def _enabled(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() not in ('0', 'false', 'no')
+
+
+def _shift_type(value):
+    if value not in SHIFT_TYPES:
+        raise ValueError('unknown shift type {!r}'.format(value))
+    return value
+
+
+def _watch_time(value):
+    return datetime.datetime.strptime(value, WATCH_TIME_FORMAT) if value else None
+
+
+def import_history(show_db, uid, source, fmt=JSON_LINES, update_series=None):
+    # Reads records one at a time and writes them in batches. update_series, if
+    # given, is called with series the database only has placeholders for, so
+    # their episodes can be resolved.
+    records = _json_reader(source) if fmt == JSON_LINES else _csv_reader(source)
+    counts = {'subscriptions': 0, 'seen': 0, 'unresolved': 0}
+    subscriptions = []
+    seen = []
+    touched_series = set()
+
+    def flush_subscriptions():
+        show_db.import_subscriptions(uid, subscriptions)
+        counts['subscriptions'] += len(subscriptions)
+        if update_series is not None:
+            for series_id in show_db.placeholder_series_ids(series_id for series_id, _, _, _, _ in subscriptions):
+                update_series(series_id)
+        del subscriptions[:]
+
+    def flush_seen():
+        flush_subscriptions()
+        found = show_db.import_seen(uid, seen)
+        counts['seen'] += found
+        counts['unresolved'] += len(seen) - found
+        touched_series.update(series_id for series_id, _, _, _ in seen)
+        del seen[:]
+
+    for line_number, record in enumerate(records, 1):
+        try:
+            if record['record'] == SUBSCRIPTION:
+                subscriptions.append((
+                    int(record['series_id']),
+                    record.get('series_name') or '',
+                    int(record.get('shift_len', 0)),
+                    _shift_type(record.get('shift_type', 'HOURS')),
+                    _enabled(record.get('enabled', True)),
+                ))
+            elif record['record'] == SEEN:
+                seen.append((
+                    int(record['series_id']),
+                    int(record['season']),
+                    int(record['episode']),
+                    _watch_time(record.get('watch_time')),
+                ))
+            else:
+                raise ValueError('unknown record type {!r}'.format(record['record']))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError('record {}: {}'.format(line_number, e))
+        if len(seen) >= IMPORT_BATCH_SIZE:
+            flush_seen()
+
+    flush_seen()
+    show_db.compact_watermarks(uid, touched_series)
+    return HistoryCounts(**counts)
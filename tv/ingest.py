@@ -0,0 +1,75 @@
+import threading
+
+import six.moves.queue
+
+from tv.db.db import MAX_UPDATE_FAILURES
+
+
+QUEUED = 'queued'
+DONE = 'done'
+FAILED = 'failed'
+UNAVAILABLE = 'unavailable'
+
+DEFAULT_INGEST_WORKERS = 2
+
+
+def ingest_status(state):
+    # status from ShowDatabase.series_state, so every server process gives the same answer
+    if state is None:
+        return None
+    last_updated, update_failures = state
+    if last_updated > 0:
+        return DONE
+    if update_failures >= MAX_UPDATE_FAILURES:
+        return UNAVAILABLE
+    return FAILED if update_failures else QUEUED
+
+
+class IngestQueue(object):
+    def __init__(self, make_db, workers=DEFAULT_INGEST_WORKERS):
+        self._make_db = make_db
+        self._pending = six.moves.queue.Queue()
+        self._lock = threading.Lock()
+        # series queued or loading in this process, so repeated subscribes are folded together
+        self._queued = set()
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, series_id):
+        with self._lock:
+            if series_id in self._queued:
+                return
+            self._queued.add(series_id)
+        self._pending.put(series_id)
+
+    def _load(self, series_id):
+        show_db = self._make_db()
+        try:
+            show_db.update_series(series_id)
+        finally:
+            show_db.close()
+
+    def _mark_failed(self, series_id):
+        # update_series.py retries flagged series on its next run
+        show_db = self._make_db()
+        try:
+            show_db.mark_update_failed(series_id)
+        finally:
+            show_db.close()
+
+    def _work(self):
+        while True:
+            series_id = self._pending.get()
+            try:
+                self._load(series_id)
+            except Exception as e:
+                print('Cannot update series {}: {}'.format(series_id, e))
+                try:
+                    self._mark_failed(series_id)
+                except Exception as e:
+                    print('Cannot mark series {} for retry: {}'.format(series_id, e))
+            finally:
+                with self._lock:
+                    self._queued.discard(series_id)
@@ -0,0 +1,110 @@
+import collections
+import contextlib
+import re
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_SQL_TARGET = re.compile(r'^\s*(?:(UPDATE)|(SELECT|INSERT|DELETE)\b.*?\b(?:FROM|INTO))\s+`?(\w+)', re.I | re.S)
+_LABEL_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n'}
+
+
+def sql_name(query):
+    match = _SQL_TARGET.match(query)
+    if match is None:
+        return query.split(None, 1)[0].lower() if query.strip() else 'empty'
+    return '{} {}'.format((match.group(1) or match.group(2)).lower(), match.group(3).lower())
+
+
+def _label(value):
+    return ''.join(_LABEL_ESCAPES.get(char, char) for char in str(value))
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[index] += 1
+
+
+class Registry(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = collections.defaultdict(lambda: Histogram(self._buckets))
+
+    def observe(self, kind, name, seconds):
+        with self._lock:
+            self._histograms[(kind, name)].observe(seconds)
+
+    def render(self):
+        lines = [
+            '# HELP tvq_duration_seconds Time spent per request, sql statement, tvdb call and render phase.',
+            '# TYPE tvq_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (kind, name), histogram in sorted(self._histograms.items()):
+                labels = 'kind="{}",name="{}"'.format(_label(kind), _label(name))
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append('tvq_duration_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, count))
+                lines.append('tvq_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, histogram.count))
+                lines.append('tvq_duration_seconds_sum{{{}}} {}'.format(labels, histogram.total))
+                lines.append('tvq_duration_seconds_count{{{}}} {}'.format(labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# timings of the request being served on this thread, if any
+_current = threading.local()
+
+
+def observe(kind, name, seconds):
+    REGISTRY.observe(kind, name, seconds)
+    timings = getattr(_current, 'timings', None)
+    if timings is not None:
+        timings.append((kind, name, seconds))
+
+
+@contextlib.contextmanager
+def timed(kind, name):
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(kind, name, time.time() - start)
+
+
+def start_request():
+    _current.timings = []
+    _current.start = time.time()
+
+
+def finish_request():
+    timings = getattr(_current, 'timings', None)
+    if timings is None:
+        return None, []
+    elapsed = time.time() - _current.start
+    _current.timings = None
+    return elapsed, timings
+
+
+def summarize(timings):
+    totals = collections.OrderedDict()
+    for kind, name, seconds in timings:
+        count, total = totals.get((kind, name), (0, 0.0))
+        totals[(kind, name)] = (count + 1, total + seconds)
+    return ', '.join(
+        '{} {}: {:.1f}ms x{}'.format(kind, name, total * 1000, count)
+        for (kind, name), (count, total) in sorted(totals.items(), key=lambda item: -item[1][1])
+    )
@@ -1,15 +1,20 @@
-import datetime
+import hashlib
+import itertools
 import json
 from six.moves.urllib.error import HTTPError
+import six.moves.queue
 import six.moves.urllib.parse
-import six.moves.urllib.request
+import threading
 import time
 
 from retry_decorator import retry
 
+from tvdb.cache import ResponseCache, TokenStore
+from tvdb.transport import KeepAliveTransport
 
-with open('/etc/tvq/api_key') as api_fobj:
-    API_KEY = api_fobj.read().rstrip('\n')
+
+API_KEY_FILE = '/etc/tvq/api_key'
+TOKEN_FILE = '/var/cache/tvq/tvdb_token.json'
 
 API_URL = 'https://api.thetvdb.com/'
 
@@ -17,84 +22,281 @@ SEARCH = 'search/series?name={}'
 SERIES = 'series/{}'
 EPISODES = 'series/{}/episodes?page={}'
 UPDATED = 'updated/query?fromTime={}'
+UPDATED_UNTIL = 'updated/query?fromTime={}&toTime={}'
 
 
 THREE_DAYS = 3 * 24 * 3600
+# the api refuses update queries spanning more than a week
+MAX_UPDATE_WINDOW = 7 * 24 * 3600
 
 
 IGNORED_ERRORS = {'invalidLanguage'}
 
+DEFAULT_PAGE_WORKERS = 4
+
+# tokens are good for 24 hours; expire them early to avoid race conditions
+TOKEN_LIFETIME = 23 * 3600
+
+_api_keys = {}
+_api_keys_lock = threading.Lock()
+
+
+def load_api_key(path=API_KEY_FILE):
+    with _api_keys_lock:
+        if path not in _api_keys:
+            with open(path) as api_fobj:
+                _api_keys[path] = api_fobj.read().rstrip('\n')
+        return _api_keys[path]
+
+
+class RateLimiter(object):
+    def __init__(self, requests_per_second):
+        self._interval = 1.0 / requests_per_second
+        self._lock = threading.Lock()
+        self._next_request = time.time()
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            delay = self._next_request - now
+            self._next_request = max(now, self._next_request) + self._interval
+        if delay > 0:
+            time.sleep(delay)
+
 
 class TvDbApi(object):
-    def __init__(self, api_key=API_KEY):
+    def __init__(
+        self,
+        api_key=None,
+        rate_limiter=None,
+        api_url=API_URL,
+        cache_dir=None,
+        page_workers=DEFAULT_PAGE_WORKERS,
+        observer=None,
+        token_file=TOKEN_FILE,
+    ):
+        # nothing is read or requested until the first api call
         self._key = api_key
-        self._get_token()
+        # called with ('tvdb', endpoint, seconds) after every http request, for profiling
+        self._observer = observer
+        self._rate_limiter = rate_limiter
+        self._url = api_url
+        self._cache_dir = cache_dir
+        self._cache = None if cache_dir is None else ResponseCache(cache_dir)
+        self._page_workers = page_workers
+        self._transport = KeepAliveTransport(api_url, max_connections=page_workers)
+        self._token_file = token_file
+        self._token_store = None if token_file is None else TokenStore(token_file)
+        self._token_lock = threading.Lock()
+        self._token = None
+        self._expiration = 0
 
-    def _get_token(self):
-        # expire after 23 hours to avoid race conditions
-        self._expiration = datetime.datetime.now() + datetime.timedelta(hours=23)
+    def copy(self, rate_limiter=None):
+        return TvDbApi(
+            self._key,
+            rate_limiter=rate_limiter,
+            api_url=self._url,
+            cache_dir=self._cache_dir,
+            page_workers=self._page_workers,
+            observer=self._observer,
+            token_file=self._token_file,
+        )
+
+    def _throttle(self):
+        if self._rate_limiter is not None:
+            self._rate_limiter.wait()
+
+    def _request(self, method, url, body=None, headers=None):
+        self._throttle()
+        start = time.time()
+        try:
+            status, response = self._transport.request(method, url, body=body, headers=headers)
+        except Exception:
+            self._observe('tvdb_error', url, start)
+            raise
+        self._observe('tvdb' if status in (200, 404) else 'tvdb_error', url, start)
+        if status == 404:
+            return None
+        if status != 200:
+            raise HTTPError(url, status, 'unexpected status {}'.format(status), None, None)
+        return json.loads(response.decode('utf-8'))
+
+    def _observe(self, kind, url, start):
+        if self._observer is not None:
+            path = six.moves.urllib.parse.urlparse(url).path
+            endpoint = '/'.join(part for part in path.split('/') if part and not part.isdigit())
+            self._observer(kind, endpoint, time.time() - start)
 
+    def _login(self):
+        if self._key is None:
+            self._key = load_api_key()
         data = json.dumps({'apikey': self._key})
-        request = six.moves.urllib.request.Request(
-            url=six.moves.urllib.parse.urljoin(API_URL, 'login'),
-            data=str.encode(data),
+        response = self._request(
+            'POST',
+            six.moves.urllib.parse.urljoin(self._url, 'login'),
+            body=str.encode(data),
             headers={
                 'Accept': 'application/json',
                 'Content-Type': 'application/json',
             },
         )
-        response = six.moves.urllib.request.urlopen(request).read()
-        self._token = json.loads(response.decode('utf-8'))['token']
+        return response['token'], time.time() + TOKEN_LIFETIME
+
+    def _token_identity(self):
+        if self._key is None:
+            self._key = load_api_key()
+        return hashlib.sha1(u'{} {}'.format(self._url, self._key).encode('utf-8')).hexdigest()
+
+    def _get_token(self):
+        if self._token_store is None:
+            return self._login()
+        # another process may have logged in already; otherwise log in and share the token.
+        # Only token store failures fall back to logging in unshared; login errors propagate.
+        identity = self._token_identity()
+        logging_in = False
+        login = None
+        try:
+            with self._token_store.locked():
+                token, expires = self._token_store.get(identity)
+                if token is not None:
+                    return token, expires
+                logging_in = True
+                login = self._login()
+                self._token_store.put(identity, *login)
+                return login
+        except (IOError, OSError):
+            if login is not None:
+                return login
+            if logging_in:
+                raise
+            return self._login()
 
     def _update_token(self):
-        if datetime.datetime.now() > self._expiration:
-            self._get_token()
+        with self._token_lock:
+            if self._token is None or time.time() > self._expiration:
+                self._token, self._expiration = self._get_token()
+            return self._token
+
+    def _reject_token(self, token):
+        # the api refused the token, so neither this client nor other processes should reuse it
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+        if self._token_store is not None:
+            try:
+                with self._token_store.locked():
+                    self._token_store.discard(self._token_identity(), token)
+            except (IOError, OSError):
+                pass
 
-    def _headers(self):
-        self._update_token()
+    def _headers(self, token):
         return {
             'Accept': 'application/json',
-            'Authorization': 'Bearer {}'.format(self._token),
+            'Authorization': 'Bearer {}'.format(token),
         }
 
     @retry(Exception, tries=3, timeout_secs=0.1)
-    def _get(self, url_format, *parameters):
+    def _get(self, url_format, *parameters, **kwargs):
+        # responses fetched with a version, like a series' lastUpdated, can be served from disk
+        version = kwargs.get('version')
         assert not any('/' in param for param in parameters)
         safe_inputs = (six.moves.urllib.parse.quote(param, safe='') for param in parameters)
-        url = six.moves.urllib.parse.urljoin(API_URL, url_format.format(*safe_inputs))
-        request = six.moves.urllib.request.Request(url=url, headers=self._headers())
+        url = six.moves.urllib.parse.urljoin(self._url, url_format.format(*safe_inputs))
+        cacheable = version is not None and self._cache is not None
+        if cacheable:
+            cached_response = self._cache.get(url, version)
+            if cached_response is not None:
+                return cached_response
+        token = self._update_token()
         try:
-            response = six.moves.urllib.request.urlopen(request).read()
-        except HTTPError as ex:
-            if ex.code == 404:
-                return None
-            else:
-                raise
-        loaded_response = json.loads(response.decode('utf-8'))
+            loaded_response = self._request('GET', url, headers=self._headers(token))
+        except HTTPError as e:
+            if e.code == 401:
+                self._reject_token(token)
+            raise
+        if loaded_response is None:
+            return None
         if any(err not in IGNORED_ERRORS for err in loaded_response.get('errors', {})):
             raise RuntimeError('error loading {}: {}'.format(url, loaded_response['errors']))
+        if cacheable:
+            self._cache.put(url, version, loaded_response)
         return loaded_response
 
     def search(self, query):
         results = self._get(SEARCH, query)
         return [] if results is None else results['data']
 
-    def updates(self, from_time=None):
+    def updates(self, from_time=None, to_time=None):
         if from_time is None:
             from_time = int(time.time() - THREE_DAYS)
-        return self._get(UPDATED, str(from_time))['data']
+        if to_time is None:
+            response = self._get(UPDATED, str(from_time))
+        else:
+            response = self._get(UPDATED_UNTIL, str(from_time), str(to_time))
+        return response['data'] or []
 
     def series(self, series_id):
         return self._get(SERIES, str(series_id))['data']
 
-    def episodes(self, series_id):
-        next_page = 1
+    def _fetch_pages(self, series_id, pages, last_updated):
+        # fetch pages on a few threads, but hand them back in order
+        results = {}
+        ready = {page: threading.Event() for page in pages}
+        pending = six.moves.queue.Queue()
+        for page in pages:
+            pending.put(page)
+        cancelled = threading.Event()
+
+        def fetch():
+            while not cancelled.is_set():
+                try:
+                    page = pending.get_nowait()
+                except six.moves.queue.Empty:
+                    return
+                try:
+                    results[page] = (self._get(EPISODES, str(series_id), str(page), version=last_updated), None)
+                except Exception as e:
+                    results[page] = (None, e)
+                ready[page].set()
+
+        for _ in range(min(self._page_workers, len(pages))):
+            thread = threading.Thread(target=fetch)
+            thread.daemon = True
+            thread.start()
+        try:
+            for page in pages:
+                ready[page].wait()
+                response, error = results.pop(page)
+                if error is not None:
+                    raise error
+                yield response
+        finally:
+            cancelled.set()
+
+    def _remaining_pages(self, series_id, first_page, last_updated):
+        try:
+            next_page = first_page['links']['next']
+            last_page = first_page['links'].get('last')
+        except (AttributeError, KeyError, TypeError):
+            return
+        if next_page is None:
+            return
+        if last_page is not None:
+            for page in self._fetch_pages(series_id, list(range(next_page, last_page + 1)), last_updated):
+                yield page
+            return
         while next_page is not None:
-            page = self._get(EPISODES, str(series_id), str(next_page))
+            page = self._get(EPISODES, str(series_id), str(next_page), version=last_updated)
+            yield page
             try:
                 next_page = page['links']['next']
             except (AttributeError, TypeError):
                 next_page = None
+
+    def episodes(self, series_id, last_updated=None):
+        first_page = self._get(EPISODES, str(series_id), '1', version=last_updated)
+        pages = itertools.chain([first_page], self._remaining_pages(series_id, first_page, last_updated))
+        for page in pages:
             try:
                 for datum in page['data']:
                     yield datum
@@ -0,0 +1,172 @@
+import collections
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # without fcntl, processes that find no valid token may each log in
+    fcntl = None
+
+
+DEFAULT_MAX_SEARCHES = 500
+DEFAULT_SEARCH_TTL_SECONDS = 3600
+
+
+class ResponseCache(object):
+    def __init__(self, directory):
+        self._directory = directory
+
+    def _url_directory(self, url):
+        return os.path.join(self._directory, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def get(self, url, version):
+        try:
+            with open(os.path.join(self._url_directory(url), '{}.json'.format(version))) as cache_fobj:
+                return json.load(cache_fobj)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, url, version, response):
+        url_directory = self._url_directory(url)
+        if not os.path.isdir(url_directory):
+            try:
+                os.makedirs(url_directory)
+            except OSError:
+                if not os.path.isdir(url_directory):
+                    raise
+        file_name = '{}.json'.format(version)
+        descriptor, temp_path = tempfile.mkstemp(dir=url_directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as cache_fobj:
+            json.dump(response, cache_fobj)
+        os.rename(temp_path, os.path.join(url_directory, file_name))
+        # only the latest version of a url is ever asked for again
+        for old_file in os.listdir(url_directory):
+            if old_file != file_name and old_file.endswith('.json'):
+                try:
+                    os.remove(os.path.join(url_directory, old_file))
+                except OSError:
+                    pass
+
+
+class TokenStore(object):
+    # Login tokens shared between processes, as {identity: [token, expires]} in one json file.
+    def __init__(self, path):
+        self._path = path
+
+    @contextlib.contextmanager
+    def locked(self):
+        # held while checking for a token and logging in, so only one process logs in
+        directory = os.path.dirname(self._path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        with open(self._path + '.lock', 'a') as lock_fobj:
+            if fcntl is not None:
+                fcntl.flock(lock_fobj.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_fobj.fileno(), fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self._path) as token_fobj:
+                return json.load(token_fobj)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, tokens):
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(self._path) or '.', suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as token_fobj:
+            json.dump(tokens, token_fobj)
+        os.rename(temp_path, self._path)
+
+    def get(self, identity):
+        token, expires = self._read().get(identity, (None, None))
+        if token is None or expires <= time.time():
+            return None, None
+        return token, expires
+
+    def put(self, identity, token, expires):
+        now = time.time()
+        tokens = {
+            other: entry
+            for other, entry in self._read().items()
+            if entry[1] > now
+        }
+        tokens[identity] = [token, expires]
+        self._write(tokens)
+
+    def discard(self, identity, token):
+        tokens = self._read()
+        if tokens.get(identity, (None,))[0] == token:
+            del tokens[identity]
+            self._write(tokens)
+
+
+class _PendingSearch(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class SearchCache(object):
+    def __init__(self, max_entries=DEFAULT_MAX_SEARCHES, ttl_seconds=DEFAULT_SEARCH_TTL_SECONDS):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # normalized query -> (results, stored_at), least recently used first
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+
+    @staticmethod
+    def _key(query):
+        return ' '.join(query.lower().split())
+
+    def get(self, query, loader):
+        # Results are shared between callers and must not be modified.
+        # Concurrent misses for the same query wait on a single loader call.
+        key = self._key(query)
+        with self._lock:
+            if key in self._entries:
+                results, stored_at = self._entries.pop(key)
+                if time.time() - stored_at <= self._ttl_seconds:
+                    self._entries[key] = (results, stored_at)
+                    return results
+            pending = self._pending.get(key)
+            loading = pending is None
+            if loading:
+                pending = self._pending[key] = _PendingSearch()
+
+        if not loading:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.results
+
+        try:
+            pending.results = loader(query)
+        except BaseException as e:
+            pending.error = e
+            raise
+        else:
+            with self._lock:
+                self._entries[key] = (pending.results, time.time())
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+            return pending.results
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
@@ -0,0 +1,66 @@
+import socket
+import threading
+
+import six.moves.http_client
+import six.moves.urllib.parse
+
+
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_TIMEOUT = 30
+
+
+class KeepAliveTransport(object):
+    def __init__(self, base_url, max_connections=DEFAULT_MAX_CONNECTIONS, timeout=DEFAULT_TIMEOUT):
+        parsed = six.moves.urllib.parse.urlsplit(base_url)
+        if parsed.scheme == 'https':
+            self._connection_class = six.moves.http_client.HTTPSConnection
+        else:
+            self._connection_class = six.moves.http_client.HTTPConnection
+        self._host = parsed.netloc
+        self._timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def _send(self, connection, method, path, body, headers):
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        return response, response.read()
+
+    def request(self, method, url, body=None, headers=None):
+        parsed = six.moves.urllib.parse.urlsplit(url)
+        assert parsed.netloc == self._host, 'transport for {} cannot fetch {}'.format(self._host, url)
+        path = six.moves.urllib.parse.urlunsplit(('', '', parsed.path, parsed.query, ''))
+        headers = headers or {}
+
+        with self._slots:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = self._connection_class(self._host, timeout=self._timeout)
+                    response, data = self._send(connection, method, path, body, headers)
+                else:
+                    try:
+                        response, data = self._send(connection, method, path, body, headers)
+                    except (six.moves.http_client.HTTPException, socket.error):
+                        # the server may have dropped an idle keep-alive connection
+                        connection.close()
+                        connection = self._connection_class(self._host, timeout=self._timeout)
+                        response, data = self._send(connection, method, path, body, headers)
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle.append(connection)
+        return response.status, data
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
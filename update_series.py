@@ -1,3 +1,57 @@
-from tv.db.db import ShowDatabase
+import argparse
+import time
 
-ShowDatabase().update_all_series()
+from tv.db.db import DEFAULT_REQUESTS_PER_SECOND, ShowDatabase
+from tvdb.api import API_URL, TOKEN_FILE, TvDbApi
+
+
+def update_once(api, **kwargs):
+    show_db = ShowDatabase(api=api)
+    try:
+        show_db.update_all_series(**kwargs)
+    finally:
+        show_db.close()
+
+
+def run_forever(api, interval, **kwargs):
+    next_run = time.time()
+    while True:
+        try:
+            update_once(api, **kwargs)
+        except Exception as e:
+            print('Cannot update series: {}'.format(e))
+        next_run += interval
+        delay = next_run - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # the run took longer than the interval, so start again right away
+            next_run = time.time()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--force', action='store_true', help="Update every series, not just recently changed ones")
+    parser.add_argument('--workers', type=int, default=1, help="Number of series to update in parallel")
+    parser.add_argument(
+        '--requests-per-second',
+        type=float,
+        default=DEFAULT_REQUESTS_PER_SECOND,
+        help="Cap on tvdb requests across all workers",
+    )
+    parser.add_argument('--cache-dir', help="Directory for caching tvdb episode pages between runs")
+    parser.add_argument('--api-url', default=API_URL, help="Base url of the tvdb api")
+    parser.add_argument('--token-file', default=TOKEN_FILE, help="File where tvdb login tokens are shared between processes")
+    parser.add_argument('--daemon', action='store_true', help="Keep running and poll for updates every interval")
+    parser.add_argument('--interval', type=int, default=900, help="Seconds between polls in daemon mode")
+    args = parser.parse_args()
+    api = TvDbApi(api_url=args.api_url, cache_dir=args.cache_dir, token_file=args.token_file)
+    update_kwargs = {
+        'force': args.force,
+        'workers': args.workers,
+        'requests_per_second': args.requests_per_second,
+    }
+    if args.daemon:
+        run_forever(api, args.interval, **update_kwargs)
+    else:
+        update_once(api, **update_kwargs)
@@ -0,0 +1,78 @@
+import argparse
+import sys
+
+from tv.db.db import ShowDatabase
+from tv.history import CSV, FORMATS, JSON_LINES, export_history, import_history
+
+
+def _format(args, path):
+    if args.format is not None:
+        return args.format
+    return CSV if path.endswith('.csv') else JSON_LINES
+
+
+def _user_id(show_db, name):
+    uid = show_db.get_user_id(name)
+    if uid is None:
+        sys.exit('No user named {!r}'.format(name))
+    return uid
+
+
+def export_command(show_db, args):
+    uid = _user_id(show_db, args.user)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        counts = export_history(show_db, uid, output, _format(args, args.output))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    sys.stderr.write('Exported {} subscriptions and {} seen episodes\n'.format(counts.subscriptions, counts.seen))
+
+
+def import_command(show_db, args):
+    uid = _user_id(show_db, args.user)
+
+    def fetch_series(series_id):
+        print('Loading series {} from tvdb'.format(series_id))
+        show_db.update_series(series_id)
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    try:
+        counts = import_history(
+            show_db, uid, source, _format(args, args.input),
+            update_series=fetch_series if args.fetch_missing else None,
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print('Imported {} subscriptions and {} seen episodes; {} episodes were not found'.format(
+        counts.subscriptions, counts.seen, counts.unresolved,
+    ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export or import a user's subscriptions and watch history")
+    parser.add_argument('--format', choices=FORMATS, help="File format; by default csv for .csv files, else json lines")
+    commands = parser.add_subparsers(dest='command')
+    export_parser = commands.add_parser('export', help="Write a user's history")
+    export_parser.add_argument('user', help="Name of the user")
+    export_parser.add_argument('--output', default='-', help="File to write, or - for stdout")
+    import_parser = commands.add_parser('import', help="Add history to a user")
+    import_parser.add_argument('user', help="Name of the user")
+    import_parser.add_argument('--input', default='-', help="File to read, or - for stdin")
+    import_parser.add_argument(
+        '--fetch-missing', action='store_true',
+        help="Load series that are not in the database yet from tvdb, so their episodes can be matched",
+    )
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error('choose export or import')
+
+    show_db = ShowDatabase()
+    try:
+        if args.command == 'export':
+            export_command(show_db, args)
+        else:
+            import_command(show_db, args)
+    finally:
+        show_db.close()
@@ -0,0 +1,102 @@
+import io
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import time
+
+import six.moves.urllib.request
+
+try:
+    from PIL import Image
+except ImportError:
+    # without Pillow every variant is served at full size
+    Image = None
+
+
+BANNER_URL = 'http://thetvdb.com/banners/{}'
+BANNER_WIDTHS = (320, 480, 640)
+FETCH_TIMEOUT = 10
+# banners tvdb could not serve are not asked for again for this long, so pages do not wait on them
+FAILURE_RETRY_SECONDS = 600
+# fetches and resizes of different banners share this many locks
+PATH_LOCK_STRIPES = 64
+
+_SAFE_BANNER = re.compile(r'^[A-Za-z0-9_.\-/]+$')
+
+
+class BannerStore(object):
+    def __init__(self, directory):
+        self._directory = directory
+        self._path_locks = [threading.Lock() for _ in range(PATH_LOCK_STRIPES)]
+        self._lock = threading.Lock()
+        # banner -> when it may be fetched again
+        self._failures = {}
+
+    def _path_lock(self, path):
+        return self._path_locks[hash(path) % len(self._path_locks)]
+
+    def _check_failure(self, banner):
+        with self._lock:
+            retry_at = self._failures.get(banner)
+            if retry_at is not None and time.time() < retry_at:
+                raise IOError('banner {} could not be fetched recently'.format(banner))
+
+    def _record_failure(self, banner):
+        now = time.time()
+        with self._lock:
+            for failed, retry_at in list(self._failures.items()):
+                if retry_at <= now:
+                    del self._failures[failed]
+            self._failures[banner] = now + FAILURE_RETRY_SECONDS
+
+    @staticmethod
+    def _write(path, data):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as banner_fobj:
+            banner_fobj.write(data)
+        os.rename(temp_path, path)
+
+    def _original(self, banner):
+        path = os.path.join(self._directory, 'original', banner)
+        with self._path_lock(path):
+            if not os.path.exists(path):
+                self._check_failure(banner)
+                try:
+                    response = six.moves.urllib.request.urlopen(BANNER_URL.format(banner), timeout=FETCH_TIMEOUT)
+                    data = response.read()
+                except (IOError, OSError):
+                    self._record_failure(banner)
+                    raise
+                self._write(path, data)
+        return path
+
+    def _resized(self, banner, original, width):
+        path = os.path.join(self._directory, str(width), banner)
+        with self._path_lock(path):
+            if not os.path.exists(path):
+                with Image.open(original) as image:
+                    if image.size[0] <= width:
+                        return original
+                    height = int(round(image.size[1] * float(width) / image.size[0]))
+                    resized = io.BytesIO()
+                    image.resize((width, height), Image.LANCZOS).save(resized, format=image.format)
+                self._write(path, resized.getvalue())
+        return path
+
+    def path(self, banner, width=None):
+        normalized = posixpath.normpath(banner)
+        if not _SAFE_BANNER.match(banner) or normalized != banner or normalized.startswith(('.', '/')):
+            raise ValueError('invalid banner path {!r}'.format(banner))
+        original = self._original(banner)
+        if width is None or Image is None:
+            return original
+        return self._resized(banner, original, width)
@@ -0,0 +1,190 @@
+import collections
+import datetime
+import json
+import threading
+import time
+
+from tv.db.unseen import to_timestamp
+
+
+# how often each process reads the data_version of users with open streams,
+# which catches watches from other tabs and new episodes from update_series.py
+CHECK_SECONDS = 10
+# streams end quickly so they only hold a server thread for a short while;
+# browsers reconnect by themselves and resume from Last-Event-ID
+STREAM_SECONDS = 25
+RETRY_MILLISECONDS = 5000
+PREVIEW_DAYS = 7
+
+Snapshot = collections.namedtuple('Snapshot', (
+    'queued',
+    'preview',
+    'counts',
+))
+
+
+def _event(name, data):
+    return 'event: {}\ndata: {}\n\n'.format(name, json.dumps(data))
+
+
+def _air_time(moment):
+    # same format as the preview template
+    return moment.strftime('%I:%M%p').lower().lstrip('0')
+
+
+def _scheduled(episode):
+    return {
+        'id': episode.episode_id,
+        'title': episode.episode_title,
+        'series_name': episode.series_name,
+        'time': _air_time(episode.start_time),
+    }
+
+
+def _snapshot(show_db, uid, now):
+    queued = collections.OrderedDict()
+    for series in show_db.get_queued_by_series(uid, now=now):
+        for episode in series['episodes']:
+            queued[episode.episode_id] = {
+                'id': episode.episode_id,
+                'title': episode.episode_title,
+                'season': episode.season,
+                'episode': episode.episode,
+                'series': {'id': series['id'], 'name': series['name'], 'banner': series['banner']},
+            }
+    preview = show_db.get_preview(uid, days=PREVIEW_DAYS, now=now)
+    return Snapshot(
+        queued=queued,
+        preview={
+            'recording': [_scheduled(episode) for episode in preview['recording']],
+            'days': [
+                {'day': day['day'], 'episodes': [_scheduled(episode) for episode in day['episodes']]}
+                for day in preview['preview']
+            ],
+        },
+        counts=show_db.get_counts(uid, now=now),
+    )
+
+
+def _changes(previous, current):
+    added = [episode for episode_id, episode in current.queued.items() if episode_id not in previous.queued]
+    if added:
+        yield _event('queued', {'episodes': added})
+    removed = [episode_id for episode_id in previous.queued if episode_id not in current.queued]
+    if removed:
+        yield _event('removed', {'episode_ids': removed})
+    if current.preview != previous.preview:
+        yield _event('preview', current.preview)
+    if current.counts != previous.counts:
+        yield _event('counts', {'num_queued': current.counts[0], 'num_recording': current.counts[1]})
+
+
+def _position(version, now):
+    # browsers send the last id back when they reconnect, so a new stream picks up where this one ended
+    return 'id: {}:{}\n\n'.format(version, to_timestamp(now))
+
+
+def parse_position(position):
+    version, since = position.split(':')
+    return int(version), int(since)
+
+
+class VersionWatcher(object):
+    # One thread per process polls the data_version of every user with an
+    # open stream in a single query, and wakes the streams whose user changed.
+    def __init__(self, open_db, interval=CHECK_SECONDS):
+        self._open_db = open_db
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._polled = threading.Condition(self._lock)
+        # {uid: number of streams waiting}
+        self._waiting = collections.Counter()
+        self._versions = {}
+        thread = threading.Thread(target=self._poll)
+        thread.daemon = True
+        thread.start()
+
+    def wait(self, uid, version, timeout):
+        # True once the user's data_version is past version, False after timeout
+        deadline = time.time() + timeout
+        with self._lock:
+            self._waiting[uid] += 1
+            try:
+                # versions only grow, so an older poll than the caller's read is no change
+                while self._versions.get(uid, version) <= version:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._polled.wait(remaining)
+                return True
+            finally:
+                self._waiting[uid] -= 1
+                if not self._waiting[uid]:
+                    del self._waiting[uid]
+                    self._versions.pop(uid, None)
+
+    def _read_versions(self, uids):
+        show_db = self._open_db()
+        try:
+            return show_db.get_data_versions(uids)
+        finally:
+            show_db.close()
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                uids = list(self._waiting)
+            if uids:
+                try:
+                    versions = self._read_versions(uids)
+                except Exception as e:
+                    print('Cannot check data versions: {}'.format(e))
+                    versions = {}
+                with self._lock:
+                    self._versions.update((uid, version) for uid, version in versions.items() if uid in self._waiting)
+                    self._polled.notify_all()
+            time.sleep(self._interval)
+
+
+def event_stream(open_db, watcher, uid, version, since):
+    # Pushes what changed on the user's pages since they were rendered, at
+    # `since` under data_version `version`, until STREAM_SECONDS pass. A
+    # database handle from open_db is only held while loading, never while
+    # waiting; the watcher notices new versions.
+    yield 'retry: {}\n\n'.format(RETRY_MILLISECONDS)
+    show_db = open_db()
+    try:
+        current_version = show_db.get_data_version(uid)
+        if current_version != version:
+            # the data behind the page is gone, so the difference cannot be worked out
+            yield _event('reload', {})
+            return
+        # views are loaded for the moment asked for, so the page's view can be rebuilt exactly
+        previous = _snapshot(show_db, uid, since)
+        next_change = show_db.get_next_change(uid, now=since)
+    finally:
+        show_db.close()
+
+    day = since.date()
+    deadline = time.time() + STREAM_SECONDS
+    version_changed = False
+    while True:
+        now = datetime.datetime.now()
+        if version_changed or now >= next_change or now.date() != day:
+            show_db = open_db()
+            try:
+                current_version = show_db.get_data_version(uid)
+                current = _snapshot(show_db, uid, now)
+                next_change = show_db.get_next_change(uid, now=now)
+            finally:
+                show_db.close()
+            for event in _changes(previous, current):
+                yield event
+            previous, version, day = current, current_version, now.date()
+        # sent after every wait, which is also how a closed connection is noticed
+        yield _position(version, now)
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        wait = min(remaining, (next_change - datetime.datetime.now()).total_seconds())
+        version_changed = watcher.wait(uid, version, max(wait, 0.5))
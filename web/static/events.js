@@ -0,0 +1,30 @@
+// Keeps a page current with /events instead of reloading it. The body carries
+// the data version and time the page was built from; handlers get the parsed
+// data of each named event.
+function listenForChanges(handlers) {
+    var body = $('body');
+    if (!window.EventSource || body.attr('data-version') === undefined) {
+        return;
+    }
+    var source = new EventSource('/events?' + $.param({
+        'version': body.attr('data-version'),
+        'since': body.attr('data-rendered-at')
+    }));
+
+    source.addEventListener('reload', function() {
+        source.close();
+        window.location.reload();
+    });
+
+    source.addEventListener('counts', function(event) {
+        var counts = JSON.parse(event.data);
+        $('.navbar .num-queued').text(counts.num_queued);
+        $('.navbar .num-recording').toggleClass('hidden', counts.num_recording === 0);
+    });
+
+    $.each(handlers, function(name, handler) {
+        source.addEventListener(name, function(event) {
+            handler(JSON.parse(event.data));
+        });
+    });
+}
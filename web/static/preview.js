@@ -0,0 +1,30 @@
+function renderDay(label, episodes) {
+    var list = $('<ul class="list-group">').append(
+        $('<li class="list-group-item active">').addClass(label.toLowerCase()).text(label)
+    );
+    $.each(episodes, function(index, episode) {
+        var item = $('<li class="list-group-item">').
+            append($('<span class="badge">').text(episode.time)).
+            append(' ').
+            append($('<b>').text(episode.series_name));
+        if (episode.title) {
+            item.append(document.createTextNode(' - ' + episode.title));
+        }
+        list.append(item);
+    });
+    return $('<div class="day centered">').append(list);
+}
+
+function renderPreview(preview) {
+    var container = $('#preview').empty();
+    if (preview.recording.length > 0) {
+        container.append(renderDay('Recording', preview.recording));
+    }
+    $.each(preview.days, function(index, day) {
+        container.append(renderDay(day.day, day.episodes));
+    });
+}
+
+$(function() {
+    listenForChanges({'preview': renderPreview});
+});
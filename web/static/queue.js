@@ -1,11 +1,31 @@
+function decrementQueued(count) {
+    var badge = $('.navbar .num-queued');
+    badge.text(Math.max(parseInt(badge.text()) - count, 0));
+}
+
 function deleteUntil(episode_id) {
-    $('#ep_' + episode_id).parents('.panel').prevAll().remove();
+    var earlier = $('#ep_' + episode_id).parents('.panel').prevAll();
+    decrementQueued(earlier.size());
+    earlier.remove();
     deleteCur(episode_id);
 }
 
 function deleteCur(episode_id) {
-    var container = $('#ep_' + episode_id).parents('.episodes');
-    $('#ep_' + episode_id).parents('.panel').remove();
+    removeEpisode(episode_id);
+    decrementQueued(1);
+}
+
+function removeEpisode(episode_id) {
+    var panel = $('#ep_' + episode_id).parents('.panel');
+    if (panel.size() === 0) {
+        return;
+    }
+    var container = panel.parents('.episodes');
+    panel.remove();
+    updateSeries(container);
+}
+
+function updateSeries(container) {
     var numItems = container.children('.panel').size();
     container.prev().children('span.badge').text(numItems);
     container.find('.panel-footer').first().children('button.watch-until').remove();
@@ -14,26 +34,251 @@ function deleteCur(episode_id) {
     } else if (numItems === 1) {
         container.parents('.series').find('.episode-label').text('episode');
     }
-    $('.navbar .num-queued').text($('.episode').size());
 }
 
 function failDelete(item) {
     alert('Failed to communicate with server. Please try again later.');
 }
 
+// Clicks are applied to the page right away and sent to the server together
+// once they stop coming for a moment.
+var WATCH_FLUSH_DELAY = 500;
+var pendingActions = [];
+var flushTimer = null;
+
+function queueAction(action, episode_id) {
+    pendingActions.push({'action': action, 'episode_id': parseInt(episode_id)});
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flushActions, WATCH_FLUSH_DELAY);
+}
+
+function flushActions() {
+    clearTimeout(flushTimer);
+    flushTimer = null;
+    if (pendingActions.length === 0) {
+        return;
+    }
+    var actions = pendingActions;
+    pendingActions = [];
+    $.ajax('/watch/batch', {
+        'type': 'POST',
+        'contentType': 'application/json',
+        'data': JSON.stringify({'actions': actions}),
+        'error': function() {
+            failDelete();
+            // the page already shows the episodes as watched, so reload the real queue
+            window.location.reload();
+        }
+    });
+}
+
+function sendPendingActions() {
+    // the page is going away, so a timer or ajax call might never finish
+    if (pendingActions.length === 0 || !navigator.sendBeacon) {
+        flushActions();
+        return;
+    }
+    var body = new Blob([JSON.stringify({'actions': pendingActions})], {'type': 'application/json'});
+    if (navigator.sendBeacon('/watch/batch', body)) {
+        pendingActions = [];
+        clearTimeout(flushTimer);
+    }
+}
+
+function renderEpisode(episode, first) {
+    var panel = $('<div class="panel panel-info">');
+    $('<div class="panel-heading episode clickable">').
+        attr('data-collapse', 'ep_' + episode.id).
+        append($('<span class="badge">').text('S' + episode.season + 'E' + episode.episode)).
+        append(document.createTextNode(' ' + (episode.title || ''))).
+        appendTo(panel);
+
+    var footer = $('<div class="panel-footer">').append(
+        $('<button class="btn btn-success watch">').attr('data-episode', episode.id).text('Watched')
+    );
+    if (!first) {
+        footer.append(' ').append(
+            $('<button class="btn btn-info watch-until">').
+                attr('data-episode', episode.id).
+                text('Watched through this episode')
+        );
+    }
+    $('<div class="collapse">').
+        attr('id', 'ep_' + episode.id).
+        attr('data-episode', episode.id).
+        append('<div class="panel-body overview hidden"></div>').
+        append(footer).
+        appendTo(panel);
+    return panel;
+}
+
+function bannerSrcset(banner) {
+    var widths = $('#queue').attr('data-banner-widths').split(',');
+    var sources = $.map(widths, function(width) {
+        return '/banner/' + banner + '?w=' + width + ' ' + width + 'w';
+    });
+    sources.push('/banner/' + banner + ' 758w');
+    return sources.join(', ');
+}
+
+function renderSeries(series) {
+    var listing = $('<div class="listing clickable" data-toggle="collapse">').attr('data-target', '#s_' + series.id);
+    if (series.banner) {
+        $('<div class="episodeBanner">').append(
+            $('<h1>').append(
+                $('<img class="img-responsive">').
+                    attr('src', '/banner/' + series.banner).
+                    attr('srcset', bannerSrcset(series.banner)).
+                    attr('sizes', '(max-width: 758px) 100vw, 758px').
+                    attr('alt', series.name).
+                    attr('title', series.name)
+            )
+        ).appendTo(listing);
+    }
+    $('<div class="episodeTitle">').
+        toggleClass('hidden', !!series.banner).
+        append('<div class="episodeTitleHeight"></div>').
+        append($('<div class="episodeTitleHolder">').append($('<h1>').text(series.name))).
+        appendTo(listing);
+    listing.append($('<span class="badge title-count">').text(series.num_episodes));
+
+    var episodes = $('<div class="collapse episodes">').attr('id', 's_' + series.id);
+    $.each(series.episodes, function(index, episode) {
+        episodes.append(renderEpisode(episode, index === 0));
+    });
+    return $('<div class="series centered">').append(listing).append(episodes);
+}
+
+function addSeries(series, prepend) {
+    // series already on the page only get the episodes they are missing
+    var container = $('#s_' + series.id);
+    if (container.size() === 0) {
+        if (prepend) {
+            $('#queue').prepend(renderSeries(series));
+        } else {
+            $('#queue').append(renderSeries(series));
+        }
+        return;
+    }
+    $.each(series.episodes, function(index, episode) {
+        if ($('#ep_' + episode.id).size() === 0) {
+            container.append(renderEpisode(episode, container.children('.panel').size() === 0));
+        }
+    });
+    updateSeries(container);
+}
+
+function addQueued(data) {
+    // newly aired episodes belong to the most recently aired series, so they go on top
+    var series = {};
+    var order = [];
+    $.each(data.episodes, function(index, episode) {
+        if (!series.hasOwnProperty(episode.series.id)) {
+            series[episode.series.id] = $.extend({'episodes': []}, episode.series);
+            order.push(episode.series.id);
+        }
+        series[episode.series.id].episodes.push(episode);
+    });
+    var unloaded = $.grep(order, function(series_id) {
+        return $('#s_' + series_id).size() === 0;
+    });
+    if (unloaded.length > 0 && $('#queue').attr('data-next-after') !== undefined) {
+        // such a series may have older episodes on a page not loaded yet, and
+        // the paging cursor is already past its new place, so only a reload can show it right
+        window.location.reload();
+        return;
+    }
+    $.each(order.reverse(), function(index, series_id) {
+        series[series_id].num_episodes = series[series_id].episodes.length;
+        addSeries(series[series_id], true);
+    });
+}
+
+function removeQueued(data) {
+    $.each(data.episode_ids, function(index, episode_id) {
+        removeEpisode(episode_id);
+    });
+}
+
+var loadingPage = false;
+
+function loadNextPage() {
+    var queue = $('#queue');
+    var after = queue.attr('data-next-after');
+    if (loadingPage || after === undefined) {
+        return;
+    }
+    loadingPage = true;
+    $.ajax('/queue/page', {
+        'data': {'after': after},
+        'success': function(page) {
+            $.each(page.series, function(index, series) {
+                addSeries(series, false);
+            });
+            if (page.next_after === null) {
+                queue.removeAttr('data-next-after');
+            } else {
+                queue.attr('data-next-after', page.next_after);
+            }
+            loadingPage = false;
+            loadIfNearBottom();
+        },
+        'error': function() {
+            loadingPage = false;
+        }
+    });
+}
+
+function loadIfNearBottom() {
+    if ($(window).scrollTop() + $(window).height() > $(document).height() - 1000) {
+        loadNextPage();
+    }
+}
+
+function loadOverview(details) {
+    var body = details.children('.overview');
+    if (details.attr('data-overview-loaded')) {
+        return;
+    }
+    details.attr('data-overview-loaded', true);
+    $.ajax('/overview', {
+        'data': {'episode_id': details.attr('data-episode')},
+        'success': function(data) {
+            if (data.overview) {
+                body.text(data.overview).removeClass('hidden');
+            }
+        },
+        'error': function() {
+            details.removeAttr('data-overview-loaded');
+        }
+    });
+}
+
 $(function() {
-    $('[data-collapse]').click(function() {
-        var ep = this.attributes['data-collapse'].value;
-        $('#' + ep).collapse('toggle');
+    var queue = $('#queue');
+
+    queue.on('click', '[data-collapse]', function() {
+        var details = $('#' + this.attributes['data-collapse'].value);
+        loadOverview(details);
+        details.collapse('toggle');
     });
 
-    $('button.watch').click(function() {
-        var data = {'episode_id': this.attributes['data-episode'].value}
-        $.ajax('/watch', {'success': deleteCur, 'error': failDelete, 'data': data});
+    queue.on('click', 'button.watch', function() {
+        var episode_id = this.attributes['data-episode'].value;
+        queueAction('watch', episode_id);
+        deleteCur(episode_id);
     });
 
-    $('button.watch-until').click(function() {
-        var data = {'episode_id': this.attributes['data-episode'].value}
-        $.ajax('/watchuntil', {'success': deleteUntil, 'error': failDelete, 'data': data});
+    queue.on('click', 'button.watch-until', function() {
+        var episode_id = this.attributes['data-episode'].value;
+        queueAction('watch_until', episode_id);
+        deleteUntil(episode_id);
     });
+
+    $(window).on('pagehide', sendPendingActions);
+
+    listenForChanges({'queued': addQueued, 'removed': removeQueued});
+
+    $(window).scroll(loadIfNearBottom);
+    loadIfNearBottom();
 });
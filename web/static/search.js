@@ -4,6 +4,26 @@ function handle_subscription(series_id) {
         addClass('btn-danger').
         removeClass('btn-success').
         removeClass('disabled');
+    $('.ingest-status[data-series-id=' + series_id + ']').text('Loading episodes...').removeClass('hidden');
+    poll_ingestion(series_id);
+}
+
+function poll_ingestion(series_id) {
+    $.ajax('/subscribe/status', {
+        'data': {'series_id': series_id},
+        'success': function(data) {
+            var label = $('.ingest-status[data-series-id=' + series_id + ']');
+            if (data.status === 'queued') {
+                setTimeout(function() { poll_ingestion(series_id); }, 1000);
+            } else if (data.status === 'failed') {
+                label.text('Episodes could not be loaded yet. They will be loaded automatically soon.');
+            } else if (data.status === 'unavailable') {
+                label.text('Episodes could not be loaded from tvdb. The series may no longer be listed there.');
+            } else {
+                label.addClass('hidden');
+            }
+        }
+    });
 }
 
 function fail_subscription() {
@@ -31,6 +51,9 @@ $(function() {
     $('button.subscription').click(function() {
         var series_id = this.attributes['data-series-id'].nodeValue;
         var data = {'series_id': series_id}
+        if (this.attributes['data-series-name']) {
+            data['name'] = this.attributes['data-series-name'].nodeValue;
+        }
         if (this.textContent == "Unsubscribe") {
             $('.modal[for_series=' + series_id + ']').modal()
         } else if (this.textContent == "Subscribe") {
@@ -1,54 +1,158 @@
 import argparse
+import datetime
+import functools
+import hashlib
+import os
+import threading
+import time
 
 import flask
 from flask import request
 
-from tv.db.db import ShowDatabase
+from tv import metrics
+from tv.db.cache import UnseenCache
+from tv.db.db import WATCH_ACTION, WATCH_UNTIL_ACTION, ShowDatabase, queue_position
+from tv.db.pool import DEFAULT_POOL_SIZE, ConnectionPool
+from tv.db.unseen import to_datetime, to_timestamp
+from tv.ingest import IngestQueue, ingest_status
 from tvdb.api import TvDbApi
+from tvdb.cache import SearchCache
+from web.banners import BANNER_WIDTHS, BannerStore
+from web.events import VersionWatcher, event_stream, parse_position
 
 app = flask.Flask(__name__)
 
-TVDB_API = None
-SHOW_DB = None
+POOL = None
+POOL_SIZE = int(os.environ.get('TVQ_POOL_SIZE', DEFAULT_POOL_SIZE))
+INGEST_QUEUE = None
+VERSION_WATCHER = None
+_GLOBALS_LOCK = threading.Lock()
+# tvdb clients are not shared between threads; each thread logs in once
+_THREAD_LOCAL = threading.local()
+
+# writes from other processes, like update_series.py or other server workers,
+# bump the user's data_version, which drops their entries here on the next
+# request; entries also expire after a few minutes in case a bump is missed
+UNSEEN_CACHE = UnseenCache(max_age_seconds=300)
+
+SEARCH_CACHE = SearchCache()
+# /search answers from series already in the database, and only asks tvdb
+# when that finds fewer than MIN_LOCAL_RESULTS
+LOCAL_SEARCH_LIMIT = 20
+MIN_LOCAL_RESULTS = 5
+
+BANNERS = BannerStore(os.environ.get('TVQ_BANNER_DIR', '/var/cache/tvq/banners'))
+# banners never change once published, so browsers may keep them for a year
+BANNER_MAX_AGE = 365 * 24 * 3600
+
+# part of every etag so pages cached by browsers are refreshed after a restart or deploy
+_STARTED = str(time.time())
+
+# time-based pages change as episodes air, so their etags also change every
+# this many seconds; finding the exact next change would load the unseen
+# episodes a 304 is meant to skip
+ETAG_TIME_BUCKET_SECONDS = 60
+
+# most actions one /watch/batch request may carry
+MAX_WATCH_ACTIONS = 500
+
+# series rendered with the /queue page itself; the rest come from /queue/page
+QUEUE_PAGE_SIZE = 10
+MAX_QUEUE_PAGE_SIZE = 100
+
+# requests slower than this are logged with their sql, tvdb and render breakdown; off when unset
+SLOW_REQUEST_MS = float(os.environ['TVQ_SLOW_REQUEST_MS']) if os.environ.get('TVQ_SLOW_REQUEST_MS') else None
 
 
 def get_api():
-    global TVDB_API
-    if TVDB_API is None:
-        TVDB_API = TvDbApi()
-    return TVDB_API
+    if getattr(_THREAD_LOCAL, 'api', None) is None:
+        _THREAD_LOCAL.api = TvDbApi(observer=metrics.observe)
+    return _THREAD_LOCAL.api
+
+
+def get_pool():
+    global POOL
+    with _GLOBALS_LOCK:
+        if POOL is None:
+            POOL = ConnectionPool(max_size=POOL_SIZE)
+        return POOL
+
+
+def get_ingest_queue():
+    global INGEST_QUEUE
+    with _GLOBALS_LOCK:
+        if INGEST_QUEUE is None:
+            INGEST_QUEUE = IngestQueue(lambda: ShowDatabase(get_api(), pool=get_pool(), cache=UNSEEN_CACHE))
+        return INGEST_QUEUE
+
+
+def get_version_watcher():
+    global VERSION_WATCHER
+    with _GLOBALS_LOCK:
+        if VERSION_WATCHER is None:
+            VERSION_WATCHER = VersionWatcher(_open_event_db)
+        return VERSION_WATCHER
+
+
+def get_db():
+    if 'show_db' not in flask.g:
+        flask.g.show_db = ShowDatabase(api=False, pool=get_pool(), cache=UNSEEN_CACHE)
+    return flask.g.show_db
 
 
 @app.before_request
-def clear_cache():
-    global SHOW_DB
-    SHOW_DB = ShowDatabase(api=False)
+def start_profile():
+    metrics.start_request()
+    # pages record when they were built so /events can tell them what changed since
+    flask.g.request_started = datetime.datetime.now()
+
+
+@app.teardown_request
+def finish_profile(exception):
+    elapsed, timings = metrics.finish_request()
+    if elapsed is None:
+        return
+    metrics.REGISTRY.observe('request', request.endpoint or 'unknown', elapsed)
+    if SLOW_REQUEST_MS is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+        app.logger.warning(
+            'slow request %s took %.1fms: %s',
+            request.full_path, elapsed * 1000, metrics.summarize(timings) or 'no timed work',
+        )
 
 
-@app.after_request
-def close_db(response):
-    SHOW_DB.close()
-    return response
+# teardown runs even when the view raises, so the connection always goes back to the pool
+@app.teardown_appcontext
+def close_db(exception):
+    show_db = flask.g.pop('show_db', None)
+    if show_db is not None:
+        show_db.close()
 
 
 def render_template(*args, **kwargs):
     uid = user_id()
     if uid is None:
-        return flask.render_template(
-            'login.html',
-            num_queued=-1,
-            num_recording=0,
-            users=SHOW_DB.user_names(),
-        )
-
-    username = SHOW_DB.get_user_name(uid) if uid else None
+        users = get_db().user_names()
+        with metrics.timed('render', 'login.html'):
+            return flask.render_template(
+                'login.html',
+                num_queued=-1,
+                num_recording=0,
+                users=users,
+            )
+
+    username = get_db().get_user_name(uid) if uid else None
+    num_queued, num_recording = get_db().get_counts(uid)
     kwargs.update({
-        'users': SHOW_DB.user_names(),
+        'data_version': get_db().get_data_version(uid),
+        'rendered_at': to_timestamp(flask.g.request_started),
+        'banner_widths': BANNER_WIDTHS,
+        'users': get_db().user_names(),
         'user': username,
-        'num_queued': SHOW_DB.num_queued(uid),
-        'num_recording': SHOW_DB.num_recording(uid),
+        'num_queued': num_queued,
+        'num_recording': num_recording,
     })
-    return flask.render_template(*args, **kwargs)
+    with metrics.timed('render', args[0]):
+        return flask.render_template(*args, **kwargs)
 
 
 def user_id():
@@ -56,84 +160,261 @@ def user_id():
     return int(cookie) if isinstance(cookie, str) else cookie
 
 
+def conditional(time_key=None):
+    # Answers 304 while the user's data_version and the view's time_key
+    # are unchanged, before the view runs any queries or renders.
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            uid = user_id()
+            if uid is None:
+                return view(*args, **kwargs)
+            parts = [_STARTED, request.full_path, uid, get_db().get_data_version(uid)]
+            if time_key is not None:
+                parts.append(time_key(uid))
+            etag = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+            if etag in request.if_none_match:
+                response = flask.Response(status=304)
+            else:
+                response = flask.make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def _time_bucket(uid):
+    return int(time.time() // ETAG_TIME_BUCKET_SECONDS)
+
+
+def _page_cursor(series):
+    # pages continue after the last series sent rather than at an offset,
+    # so series watched or aired in between are not skipped or repeated
+    newest, name_key, series_id = queue_position(series)
+    return '{}:{}:{}'.format(newest, series_id, name_key)
+
+
+def _parse_page_cursor(cursor):
+    newest, series_id, name_key = cursor.split(':', 2)
+    return int(newest), name_key, int(series_id)
+
+
 @app.route('/')
 @app.route('/queue')
+@conditional(_time_bucket)
 def queue():
-    queued_series = SHOW_DB.get_queued_by_series(user_id())
+    queued_series = get_db().get_queued_by_series(user_id())
+    first_page = queued_series[:QUEUE_PAGE_SIZE]
     return render_template(
         'queue.html',
-        queued_series=queued_series,
+        queued_series=first_page,
+        next_after=_page_cursor(first_page[-1]) if len(queued_series) > QUEUE_PAGE_SIZE else None,
     )
 
 
+@app.route('/queue/page')
+def queue_page():
+    try:
+        after = _parse_page_cursor(request.args['after']) if 'after' in request.args else None
+        limit = int(request.args.get('limit', QUEUE_PAGE_SIZE))
+    except ValueError:
+        flask.abort(400)
+    limit = max(1, min(limit, MAX_QUEUE_PAGE_SIZE))
+    queued_series = get_db().get_queued_by_series(user_id())
+    if after is not None:
+        queued_series = [series for series in queued_series if queue_position(series) > after]
+    page = [
+        {
+            'id': series['id'],
+            'name': series['name'],
+            'banner': series['banner'],
+            'num_episodes': series['num_episodes'],
+            'episodes': [
+                {
+                    'id': episode.episode_id,
+                    'title': episode.episode_title,
+                    'season': episode.season,
+                    'episode': episode.episode,
+                }
+                for episode in series['episodes']
+            ],
+        }
+        for series in queued_series[:limit]
+    ]
+    return flask.jsonify(
+        series=page,
+        next_after=_page_cursor(queued_series[limit - 1]) if len(queued_series) > limit else None,
+    )
+
+
+@app.route('/overview')
+def overview():
+    episode_id = request.args.get('episode_id', type=int)
+    if episode_id is None:
+        flask.abort(400)
+    return flask.jsonify(overview=get_db().get_overview(episode_id))
+
+
+@app.route('/banner/<path:banner>')
+def banner(banner):
+    width = request.args.get('w', type=int)
+    if width not in BANNER_WIDTHS:
+        width = None
+    try:
+        path = BANNERS.path(banner, width)
+    except (ValueError, IOError, OSError):
+        flask.abort(404)
+    response = flask.send_file(path, cache_timeout=BANNER_MAX_AGE)
+    response.cache_control.public = True
+    return response
+
+
+@app.route('/metrics')
+def metrics_page():
+    return flask.Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/login/<username>')
 def login(username):
+    uid = get_db().get_user_id(username)
+    if uid is None:
+        flask.abort(404)
     resp = flask.make_response(flask.redirect('/'))
-    resp.set_cookie('uid', str(SHOW_DB.get_user_id(username)))
+    resp.set_cookie('uid', str(uid))
     return resp
 
 
 @app.route('/search')
 def search():
     query = request.args['q']
-    try:
-        results = get_api().search(query) if query else []
-    except BaseException as e:
-        print(str(e))
-        return render_template('search_failure.html')
-    subscribed_series_ids = set(SHOW_DB.get_subscription_series_ids(user_id()))
-    for result in results:
-        result['subscribed'] = result['id'] in subscribed_series_ids
+    results = get_db().search_series(query, LOCAL_SEARCH_LIMIT) if query else []
+    if query and len(results) < MIN_LOCAL_RESULTS:
+        # too little is known locally, so add what tvdb has
+        try:
+            remote_results = SEARCH_CACHE.get(query, lambda query: get_api().search(query))
+        except BaseException as e:
+            print(str(e))
+            if not results:
+                return render_template('search_failure.html')
+            remote_results = []
+        local_ids = set(result['id'] for result in results)
+        results = results + [result for result in remote_results if result['id'] not in local_ids]
+    subscribed_series_ids = set(get_db().get_subscription_series_ids(user_id()))
+    results = [
+        dict(result, subscribed=result['id'] in subscribed_series_ids)
+        for result in results
+    ]
     return render_template('search.html', results=results)
 
 
 @app.route('/subscribe')
 def subscribe():
     series_id = request.args['series_id']
-    ShowDatabase(get_api()).subscribe(user_id(), int(series_id))
+    get_db().subscribe(user_id(), int(series_id), request.args.get('name', ''))
+    get_ingest_queue().submit(int(series_id))
     return series_id
 
 
+@app.route('/subscribe/status')
+def subscribe_status():
+    series_id = int(request.args['series_id'])
+    return flask.jsonify(series_id=series_id, status=ingest_status(get_db().series_state(series_id)))
+
+
 @app.route('/unsubscribe')
 def unsubscribe():
     series_id = request.args['series_id']
-    SHOW_DB.unsubscribe(user_id(), int(series_id))
+    get_db().unsubscribe(user_id(), int(series_id))
     return series_id
 
 
 @app.route('/subscriptions')
+@conditional()
 def subscriptions():
-    data = list(SHOW_DB.get_subscription_data(user_id()))
+    data = list(get_db().get_subscription_data(user_id()))
     return render_template('subscriptions.html', results=data)
 
 
 @app.route('/update_subscription')
 def update_subscription():
-    SHOW_DB.update_subscription(**request.args)
+    get_db().update_subscription(**request.args)
     return ''
 
 
 @app.route('/watch')
 def watch():
     episode_id = request.args['episode_id']
-    SHOW_DB.watch(user_id(), int(episode_id))
+    get_db().watch(user_id(), int(episode_id))
     return episode_id
 
 
 @app.route('/watchuntil')
 def watch_until():
     episode_id = request.args['episode_id']
-    SHOW_DB.watch_until(user_id(), int(episode_id))
+    get_db().watch_until(user_id(), int(episode_id))
     return episode_id
 
 
+@app.route('/watch/batch', methods=['POST'])
+def watch_batch():
+    # {"actions": [{"action": "watch" or "watch_until", "episode_id": 123}, ...]}, applied in order
+    body = request.get_json(force=True, silent=True)
+    try:
+        actions = [(action['action'], int(action['episode_id'])) for action in body['actions']]
+    except (KeyError, TypeError, ValueError):
+        flask.abort(400)
+    if len(actions) > MAX_WATCH_ACTIONS or any(action not in (WATCH_ACTION, WATCH_UNTIL_ACTION) for action, _ in actions):
+        flask.abort(400)
+    return flask.jsonify(applied=get_db().watch_many(user_id(), actions))
+
+
 @app.route('/preview')
+@conditional(_time_bucket)
 def preview():
-    return render_template('preview.html', **SHOW_DB.get_preview(user_id(), days=7))
+    return render_template('preview.html', **get_db().get_preview(user_id(), days=7))
+
+
+def _open_event_db():
+    return ShowDatabase(api=False, pool=get_pool(), cache=UNSEEN_CACHE)
+
+
+@app.route('/events')
+def events():
+    # server-sent events for the queue and preview pages; a reconnecting browser sends its last position
+    uid = user_id()
+    if uid is None:
+        flask.abort(403)
+    try:
+        if 'Last-Event-ID' in request.headers:
+            version, since = parse_position(request.headers['Last-Event-ID'])
+        else:
+            version, since = int(request.args['version']), int(request.args['since'])
+        since = to_datetime(since)
+    except (KeyError, ValueError, OverflowError):
+        flask.abort(400)
+    # data_version is a BIGINT UNSIGNED
+    if not 0 <= version < 2 ** 64:
+        flask.abort(400)
+    response = flask.Response(
+        event_stream(_open_event_db, get_version_watcher(), uid, version, since),
+        mimetype='text/event-stream',
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    # keeps proxies like nginx from holding events back
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--port', type=int, default=8080, help="Port to run the server")
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE, help="Maximum open database connections")
+    parser.add_argument(
+        '--slow-request-ms', type=float, default=SLOW_REQUEST_MS,
+        help="Log the time breakdown of requests slower than this",
+    )
     args = parser.parse_args()
-    app.run(host='0.0.0.0', port=args.port)
+    POOL_SIZE = args.pool_size
+    SLOW_REQUEST_MS = args.slow_request_ms
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
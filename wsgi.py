@@ -0,0 +1,25 @@
+"""Production entry point for the web app.
+
+Serve it with any multi-process WSGI server, for example:
+
+    gunicorn --workers 4 --threads 8 --bind 0.0.0.0:8080 wsgi:application
+
+Each worker process has its own database connection pool, sized by the
+TVQ_POOL_SIZE environment variable (keep it at least as large as the
+thread count), plus its own caches and background ingestion threads.
+Requests only share thread-safe objects, so both --workers and
+--threads can be raised to use more cores.
+
+Timings are kept per process, so /metrics reports the worker that
+answered. Set TVQ_SLOW_REQUEST_MS to log the sql, tvdb and render
+breakdown of requests slower than that many milliseconds.
+
+Each open queue or preview page keeps an /events stream. A stream holds
+a thread (but no database connection) for at most 25 seconds, then the
+browser reconnects and carries on where it left off. One thread per
+worker checks every open stream's user for changes, so streams cost no
+queries while they wait. Leave --threads above the number of pages
+expected to be open at once, or use an async worker class such as
+--worker-class gevent when many pages stay open.
+"""
+from web.tv_queue import app as application